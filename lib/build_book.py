@@ -0,0 +1,399 @@
+"""Build the book with the notebooks executed in parallel.
+
+jupyter-book executes the chapters one after the other, although they do not
+depend on each other. This script runs them in a pool of processes, stores the
+executed notebooks in the jupyter cache of the book and then calls
+jupyter-book with a copy of _config.yml where execute_notebooks is 'cache', so
+that the HTML builder takes the outputs from the cache instead of executing
+the notebooks again.
+
+    python lib/build_book.py                 # one worker per CPU
+    python lib/build_book.py --workers 4
+    python lib/build_book.py --no-build cooking/kenya.ipynb
+
+The timeout, allow_errors and exclude_patterns execution settings of
+_config.yml are used. The execution time of each notebook is printed and
+saved in _build/execution_times.json.
+
+A notebook is only executed again when its inputs changed. While a notebook
+runs, the files it reads (the survey files, but also the modules of lib/) are
+recorded with an audit hook; they are saved in _build/execution_inputs.json
+with their fingerprint and a hash of the code cells. The next build re-runs
+the notebook when its code, or the content of one of these files, changed.
+--force executes all notebooks.
+
+The wall time, CPU time and peak memory of every cell are measured too (see
+cell_profile.py): they are saved in _build/execution_profile.json, and
+_build/execution_profile.html lists the slowest cells, those close to the
+cell timeout and those slower than in the previous build.
+
+With --shared-data, the entries of the data cache (see data_cache.py) are
+published once in shared memory before the notebooks run: the kernels map
+the parsed survey files instead of each decoding its own copy. Only the
+entries written by previous builds, and still in use, are published. The
+entries of the data cache no longer in use are removed before every build,
+and so are the shared memory directories left by builds which were killed.
+"""
+import argparse
+import fnmatch
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import yaml
+
+from cell_profile import RECORD_CELLS, cell_records, read_profile, save_profile
+from data_cache import CACHE_DIR, file_fingerprint, prune_cache, share_cache
+
+BOOK_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUILD_DIR = os.path.join(BOOK_ROOT, '_build')
+TIMES_FILE = os.path.join(BUILD_DIR, 'execution_times.json')
+INPUTS_FILE = os.path.join(BUILD_DIR, 'execution_inputs.json')
+
+# Files read by a notebook are its inputs (the survey data, ODK results and
+# HIT sources next to the book included), except those of these directories:
+# the build, the caches, the Python installation and the system. Files under
+# hidden directories (.ipynb_checkpoints, ~/.cache...) are not inputs either.
+IGNORED_DIRS = [BUILD_DIR, CACHE_DIR, sys.prefix, sys.base_prefix,
+                '/dev', '/proc', '/sys', '/etc']
+
+# Run before and after the cells of a notebook, in its kernel, to record the
+# paths of the files opened for reading (and the measures of the cells, see
+# cell_profile.py).
+RECORD_READS = """\
+import json as _json, os as _os, sys as _sys
+_read_files = set()
+def _record_read(event, args):
+    if event == 'data_cache.read':
+        _read_files.add(args[0])
+    elif event == 'open' and isinstance(args[0], (str, bytes, _os.PathLike)):
+        mode = args[1]
+        if (mode is None or isinstance(mode, str) and not set(mode) & set('wax+')
+                or isinstance(mode, int) and not mode & (_os.O_WRONLY | _os.O_RDWR)):
+            _read_files.add(_os.path.abspath(_os.fsdecode(args[0])))
+_sys.addaudithook(_record_read)
+"""
+PRINT_READS = "print(_json.dumps({'reads': sorted(_read_files), 'cells': _cell_profile}))"
+
+
+def read_yaml(path):
+    with open(path) as f:
+        return yaml.safe_load(f) or {}
+
+
+def read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def toc_files(toc):
+    """Return the files of the table of contents, in order and without duplicates."""
+    files = []
+
+    def visit(entry):
+        if isinstance(entry, list):
+            for item in entry:
+                visit(item)
+        elif isinstance(entry, dict):
+            if 'file' in entry:
+                files.append(entry['file'])
+            for key in ('sections', 'chapters', 'parts'):
+                visit(entry.get(key))
+
+    visit(toc)
+    return list(dict.fromkeys(files))
+
+
+def book_notebooks(config, toc):
+    """Return the notebooks of the book to execute, relative to BOOK_ROOT."""
+    excluded = config.get('execute', {}).get('exclude_patterns') or []
+    notebooks = []
+    for name in toc_files(toc):
+        path = name if name.endswith('.ipynb') else name + '.ipynb'
+        if not os.path.exists(os.path.join(BOOK_ROOT, path)):
+            continue
+        if any(fnmatch.fnmatch(path, pattern) for pattern in excluded):
+            continue
+        notebooks.append(path)
+    return notebooks
+
+
+def run_notebook(nb, directory, timeout, allow_errors):
+    """Execute the notebook node nb in directory, in place.
+
+    Returns (seconds, error message or None, list of the files read by the
+    notebook, measures of its cells).
+    """
+    import nbformat
+    from nbclient import NotebookClient
+
+    nb.cells.insert(0, nbformat.v4.new_code_cell(RECORD_READS + RECORD_CELLS))
+    nb.cells.append(nbformat.v4.new_code_cell(PRINT_READS))
+    client = NotebookClient(nb, timeout=timeout, allow_errors=allow_errors,
+                            resources={'metadata': {'path': directory}})
+    start = time.perf_counter()
+    try:
+        client.execute()
+    except Exception as e:
+        return time.perf_counter() - start, '%s: %s' % (type(e).__name__, e), [], []
+    seconds = time.perf_counter() - start
+
+    reads = nb.cells.pop()
+    nb.cells.pop(0)
+    for cell in nb.cells:
+        # the cells are numbered after the recording cell
+        if cell.cell_type == 'code' and cell.get('execution_count'):
+            cell.execution_count -= 1
+            for output in cell.outputs:
+                if output.get('execution_count'):
+                    output.execution_count -= 1
+    recorded = json.loads(''.join(o.get('text', '') for o in reads.outputs) or '{}')
+    return seconds, None, recorded.get('reads', []), cell_records(nb, recorded.get('cells', []))
+
+
+def execute_notebook(path, timeout, allow_errors):
+    """Execute the notebook path (relative to BOOK_ROOT) in its own directory.
+
+    Returns (path, executed notebook or None, seconds, error message or None,
+    list of the files read by the notebook, measures of its cells).
+    """
+    import nbformat
+
+    full_path = os.path.join(BOOK_ROOT, path)
+    nb = nbformat.read(full_path, as_version=4)
+    seconds, error, files, cells = run_notebook(nb, os.path.dirname(full_path), timeout,
+                                                allow_errors)
+    return path, None if error else nb, seconds, error, files, cells
+
+
+def notebook_inputs(files, notebook):
+    """Keep the files read by notebook which are inputs of the book.
+
+    Compiled modules are replaced by their source.
+    """
+    inputs = set()
+    for path in files:
+        if '__pycache__' in path:
+            try:
+                path = importlib.util.source_from_cache(path)
+            except ValueError:
+                continue
+        ignored = IGNORED_DIRS + [d for d in [os.environ.get('MTF_SHARED_DATA')] if d]
+        if (path == notebook or any(path.startswith(d + os.sep) for d in ignored)
+                or any(part.startswith('.') for part in path.split(os.sep))
+                or not os.path.isfile(path)):
+            continue
+        inputs.add(path)
+    return sorted(inputs)
+
+
+def code_hash(path):
+    """Hash of the code cells and kernel of a notebook, markdown cells are ignored."""
+    with open(os.path.join(BOOK_ROOT, path)) as f:
+        nb = json.load(f)
+    code = [''.join(c['source']) if isinstance(c['source'], list) else c['source']
+            for c in nb['cells'] if c['cell_type'] == 'code']
+    kernel = nb.get('metadata', {}).get('kernelspec', {}).get('name')
+    return hashlib.sha256(json.dumps([kernel, code]).encode()).hexdigest()
+
+
+def is_up_to_date(path, entry, cache):
+    """Whether the executed notebook in the cache is still valid for entry."""
+    if entry is None or entry['code'] != code_hash(path):
+        return False
+    for file, previous in entry['files'].items():
+        if not os.path.exists(file):
+            return False
+        fingerprint = file_fingerprint(file, previous)
+        if fingerprint['sha256'] != previous['sha256']:
+            return False
+        # keep the new modification time, to avoid hashing the file next time
+        previous.update(fingerprint)
+    import nbformat
+    try:
+        cache.match_cache_notebook(nbformat.read(os.path.join(BOOK_ROOT, path), as_version=4))
+    except KeyError:
+        return False
+    return True
+
+
+def jupyter_cache_path(config):
+    cache = config.get('execute', {}).get('cache') or os.path.join('_build', '.jupyter_cache')
+    return os.path.join(BOOK_ROOT, cache)
+
+
+def cache_notebook(cache, path, nb, seconds):
+    """Store the executed notebook in the jupyter cache, as jupyter-book would."""
+    from jupyter_cache.base import NbBundleIn
+
+    bundle = NbBundleIn(nb, os.path.join(BOOK_ROOT, path),
+                        data={'execution_seconds': seconds})
+    cache.cache_notebook_bundle(bundle, check_validity=False, overwrite=True)
+
+
+def execute_book(notebooks, config, workers, force=False):
+    """Execute notebooks in a pool of workers and store them in the jupyter cache.
+
+    Notebooks whose inputs did not change are skipped, unless force is True.
+    Returns ({notebook: {'seconds': ..., 'error': ...}}, {notebook: measures of
+    its cells}), seconds being None for the skipped notebooks, which keep the
+    measures of the build which executed them.
+    """
+    from jupyter_cache import get_cache
+
+    settings = config.get('execute', {})
+    timeout = settings.get('timeout', 30)
+    allow_errors = settings.get('allow_errors', False)
+    cache = get_cache(jupyter_cache_path(config))
+    inputs = read_json(INPUTS_FILE)
+    previous_profile = read_profile()
+
+    times = {}
+    profile = {}
+    to_execute = []
+    for path in notebooks:
+        if not force and is_up_to_date(path, inputs.get(path), cache):
+            times[path] = {'seconds': None, 'error': None}
+            profile[path] = previous_profile.get(path, [])
+            print('%9s  %s' % ('unchanged', path))
+        else:
+            to_execute.append(path)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(execute_notebook, path, timeout, allow_errors)
+                   for path in to_execute]
+        for future in as_completed(futures):
+            path, nb, seconds, error, files, cells = future.result()
+            times[path] = {'seconds': round(seconds, 2), 'error': error}
+            profile[path] = cells
+            if nb is not None:
+                cache_notebook(cache, path, nb, seconds)
+                files = notebook_inputs(files, os.path.join(BOOK_ROOT, path))
+                inputs[path] = {'code': code_hash(path),
+                                'files': {f: file_fingerprint(f) for f in files}}
+            else:
+                inputs.pop(path, None)
+            print('%8.1fs  %s%s' % (seconds, path, '  FAILED' if error else ''))
+
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    with open(INPUTS_FILE, 'w') as f:
+        json.dump(inputs, f, indent=2)
+    return {path: times[path] for path in notebooks}, {path: profile[path] for path in notebooks}
+
+
+def _running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def remove_stale_shared_data(parent):
+    """Remove the shared directories in parent of the builds which are no longer running."""
+    for name in os.listdir(parent):
+        parts = name.split('_')
+        if (name.startswith('mtf_data_') and len(parts) > 3 and parts[2].isdigit()
+                and not _running(int(parts[2]))):
+            shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
+
+
+def publish_shared_data():
+    """Publish the data cache in shared memory, for the kernels started afterwards.
+
+    Returns the directory of the published entries, to remove after the build.
+    """
+    parent = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    remove_stale_shared_data(parent)
+    shared_dir = tempfile.mkdtemp(prefix='mtf_data_%d_' % os.getpid(), dir=parent)
+    size = share_cache(shared_dir)
+    # inherited by the workers and by the kernels they start
+    os.environ['MTF_SHARED_DATA'] = shared_dir
+    print('%.1f MB of cached data published in %s' % (size / 1e6, shared_dir))
+    return shared_dir
+
+
+def save_times(times, workers, wall_seconds):
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    with open(TIMES_FILE, 'w') as f:
+        json.dump({'workers': workers, 'wall_seconds': round(wall_seconds, 2),
+                   'notebooks': times}, f, indent=2)
+
+
+def build_html(config):
+    """Build the HTML pages with jupyter-book, taking the outputs from the cache."""
+    config = dict(config)
+    config['execute'] = dict(config.get('execute', {}),
+                             execute_notebooks='cache',
+                             cache=jupyter_cache_path(config))
+    config_file = os.path.join(BUILD_DIR, '_config.parallel.yml')
+    with open(config_file, 'w') as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+    return subprocess.call(['jupyter-book', 'build', BOOK_ROOT, '--config', config_file])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('notebooks', nargs='*',
+                        help='notebooks to execute, relative to the book (default: those of _toc.yml)')
+    parser.add_argument('-w', '--workers', type=int,
+                        default=int(os.environ.get('MTF_BUILD_WORKERS', os.cpu_count() or 1)),
+                        help='number of notebooks executed at the same time (default: number of CPUs)')
+    parser.add_argument('--no-build', action='store_true',
+                        help='only execute the notebooks, do not build the HTML pages')
+    parser.add_argument('--force', action='store_true',
+                        help='execute all notebooks, even those whose inputs did not change')
+    parser.add_argument('--shared-data', action='store_true',
+                        help='share the cached survey data between the kernels, in shared memory')
+    args = parser.parse_args(argv)
+
+    config = read_yaml(os.path.join(BOOK_ROOT, '_config.yml'))
+    notebooks = args.notebooks or book_notebooks(config, read_yaml(os.path.join(BOOK_ROOT, '_toc.yml')))
+    workers = max(1, min(args.workers, len(notebooks)))
+
+    removed = prune_cache()
+    if removed:
+        print('%d outdated files removed from the data cache' % len(removed))
+    shared_dir = publish_shared_data() if args.shared_data else None
+    # CPUs left to each kernel for its own processes (see codebook.py)
+    os.environ['MTF_KERNEL_CPUS'] = str(max(1, (os.cpu_count() or 1) // workers))
+    start = time.perf_counter()
+    try:
+        times, profile = execute_book(notebooks, config, workers, args.force)
+    finally:
+        del os.environ['MTF_KERNEL_CPUS']
+        if shared_dir is not None:
+            shutil.rmtree(shared_dir, ignore_errors=True)
+            del os.environ['MTF_SHARED_DATA']
+    wall_seconds = time.perf_counter() - start
+    save_times(times, workers, wall_seconds)
+    save_profile(profile, config.get('execute', {}).get('timeout', 30))
+
+    executed = [t['seconds'] for t in times.values() if t['seconds'] is not None]
+    print('%d notebooks executed in %.1fs with %d workers (%.1fs one after the other), %d unchanged'
+          % (len(executed), wall_seconds, workers, sum(executed), len(times) - len(executed)))
+
+    failed = [path for path, t in times.items() if t['error']]
+    for path in failed:
+        print('%s failed: %s' % (path, times[path]['error']), file=sys.stderr)
+    if failed and not config.get('execute', {}).get('allow_errors', False):
+        return 1
+    if args.no_build:
+        return 0
+    return build_html(config)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""Time, CPU time and memory of each cell of the notebooks of a build.
+
+build_book.py runs RECORD_CELLS in the kernel of each notebook before its
+cells: IPython callbacks then measure, for every cell, its wall time, the CPU
+time of the kernel and how much the cell raised the peak memory (maximum
+resident set size) of the kernel. The peak only grows: a cell using less
+memory than the cells before it has no rise, and the peak of the kernel at
+the end of each cell is kept too. The measures of the whole build are saved in
+_build/execution_profile.json, with a summary page,
+_build/execution_profile.html, listing the slowest cells, the cells close to
+the timeout of _config.yml and the cells slower than in the previous build.
+"""
+import hashlib
+import html
+import json
+import os
+
+BOOK_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROFILE_FILE = os.path.join(BOOK_ROOT, '_build', 'execution_profile.json')
+REPORT_FILE = os.path.join(BOOK_ROOT, '_build', 'execution_profile.html')
+
+# cells taking more than this share of the cell timeout are flagged
+TIMEOUT_SHARE = 0.5
+# a cell regressed when it takes REGRESSION_FACTOR times as long as in the
+# previous build, and at least REGRESSION_SECONDS more
+REGRESSION_FACTOR = 1.5
+REGRESSION_SECONDS = 1.0
+# number of cells listed in the summary page
+SLOWEST = 20
+
+RECORD_CELLS = """\
+import resource as _resource, time as _time
+_cell_profile = []
+_cell_start = None
+def _max_rss():
+    max_rss = _resource.getrusage(_resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return max_rss if _sys.platform == 'darwin' else max_rss * 1024
+def _start_cell(*args):
+    global _cell_start
+    _cell_start = (_time.perf_counter(), _time.process_time(), _max_rss())
+def _end_cell(*args):
+    global _cell_start
+    if _cell_start is not None:
+        max_rss = _max_rss()
+        _cell_profile.append({
+            'wall': _time.perf_counter() - _cell_start[0],
+            'cpu': _time.process_time() - _cell_start[1],
+            'peak_rise': max_rss - _cell_start[2],
+            'max_rss': max_rss})
+    _cell_start = None
+get_ipython().events.register('pre_run_cell', _start_cell)
+get_ipython().events.register('post_run_cell', _end_cell)
+"""
+
+
+def _source(cell):
+    return ''.join(cell['source']) if isinstance(cell['source'], list) else cell['source']
+
+
+def cell_records(nb, measures):
+    """Match the measures of a kernel with the cells of the notebook nb.
+
+    Empty code cells are not executed, so they have no measure.
+    """
+    cells = [(i, _source(c)) for i, c in enumerate(nb['cells'])
+             if c['cell_type'] == 'code' and _source(c).strip()]
+    records = []
+    for (index, source), measure in zip(cells, measures):
+        records.append({
+            'cell': index,
+            'code': hashlib.sha256(source.encode()).hexdigest()[:16],
+            'first_line': source.strip().split('\n')[0][:80],
+            'wall': round(measure['wall'], 3),
+            'cpu': round(measure['cpu'], 3),
+            'peak_rise': measure['peak_rise'],
+            'max_rss': measure['max_rss'],
+        })
+    return records
+
+
+def read_profile(path=PROFILE_FILE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def flag_cells(profile, previous, timeout):
+    """Flag, in place, the cells close to timeout and those slower than in previous.
+
+    A cell is compared with the cell of the previous build having the same
+    code in the same notebook.
+    """
+    for notebook, records in profile.items():
+        before = {r['code']: r for r in previous.get(notebook, [])}
+        for record in records:
+            record['near_timeout'] = bool(timeout) and record['wall'] > TIMEOUT_SHARE * timeout
+            old = before.get(record['code'])
+            record['previous_wall'] = old['wall'] if old else None
+            record['regression'] = bool(
+                old and record['wall'] > REGRESSION_FACTOR * old['wall']
+                and record['wall'] - old['wall'] > REGRESSION_SECONDS)
+    return profile
+
+
+def slowest_cells(profile, n=SLOWEST):
+    """The n slowest cells of the build, as (notebook, record)."""
+    cells = [(notebook, r) for notebook, records in profile.items() for r in records]
+    return sorted(cells, key=lambda c: c[1]['wall'], reverse=True)[:n]
+
+
+def _row(notebook, record):
+    flags = [name for name, flag in (('close to timeout', record.get('near_timeout')),
+                                     ('regression', record.get('regression'))) if flag]
+    previous = record.get('previous_wall')
+    return ('<tr%s><td>%s</td><td>%d</td><td><code>%s</code></td><td>%.2f</td>'
+            '<td>%s</td><td>%.2f</td><td>%.0f</td><td>%.0f</td><td>%s</td></tr>'
+            % (' class="flagged"' if flags else '', html.escape(notebook), record['cell'],
+               html.escape(record['first_line']), record['wall'],
+               '' if previous is None else '%.2f' % previous, record['cpu'],
+               record['peak_rise'] / 1e6, record['max_rss'] / 1e6, ', '.join(flags)))
+
+
+def write_report(profile, timeout, path=REPORT_FILE):
+    """Write the HTML summary page of profile."""
+    flagged = [(n, r) for n, records in profile.items() for r in records
+               if r.get('near_timeout') or r.get('regression')]
+    header = ('<tr><th>notebook</th><th>cell</th><th>code</th><th>wall (s)</th>'
+              '<th>previous (s)</th><th>CPU (s)</th><th>peak memory rise (MB)</th>'
+              '<th>kernel peak after (MB)</th><th></th></tr>')
+    sections = [('Slowest cells', slowest_cells(profile)), ('Flagged cells', flagged)]
+    body = ''.join('<h2>%s</h2><table>%s%s</table>'
+                   % (title, header, ''.join(_row(n, r) for n, r in cells))
+                   for title, cells in sections)
+    total = sum(r['wall'] for records in profile.values() for r in records)
+    with open(path, 'w') as f:
+        f.write('<!DOCTYPE html><html><head><meta charset="utf-8">'
+                '<title>Execution profile</title><style>'
+                'body{font-family:sans-serif} td,th{padding:2px 8px;text-align:left}'
+                'tr.flagged{background:#fdd}</style></head><body>'
+                '<h1>Execution profile</h1><p>%d notebooks, %d cells, %.1fs in total; '
+                'cell timeout: %ss.</p>%s</body></html>'
+                % (len(profile), sum(len(r) for r in profile.values()), total, timeout, body))
+
+
+def save_profile(profile, timeout):
+    """Flag the cells of profile against the previous build, and save the JSON and HTML reports."""
+    flag_cells(profile, read_profile(), timeout)
+    os.makedirs(os.path.dirname(PROFILE_FILE), exist_ok=True)
+    with open(PROFILE_FILE, 'w') as f:
+        json.dump(profile, f, indent=2)
+    write_report(profile, timeout)
+    return profile
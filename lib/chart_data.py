@@ -0,0 +1,51 @@
+"""Data of the stacked bar charts.
+
+get_bar_chart_data has the signature of plot_utils.get_bar_chart_data and
+returns data of the layout given by bar_chart_data, but the groups x answers
+matrix of counts is built at once from the codes of the two columns used by
+the chart (one bincount), instead of filtering the survey once per group and
+answer.
+
+The result is not memoized: computing it costs about as much as hashing the
+two columns would.
+"""
+import numpy as np
+import pandas as pd
+
+
+def bar_chart_data(df, groups, group_column, answers, answer_column):
+    """Data of the stacked bar chart of the answers in answer_column, by group.
+
+    The bars are the groups and each bar is split by answer, with the number
+    of rows of df having this group and this answer. Rows whose group or
+    answer is not listed are not counted. The layout is:
+
+        {'x_labels': [group, ...],
+         'bars_labels': [answer, ...],
+         'bars_data': [[count of the answer in each group, ...] for each answer]}
+
+    with Python ints as counts.
+    """
+    groups, answers = pd.Index(list(groups)), pd.Index(list(answers))
+    if not (groups.is_unique and answers.is_unique):
+        raise ValueError('the groups and the answers of a bar chart must be unique')
+    group_codes = groups.get_indexer(df[group_column])
+    answer_codes = answers.get_indexer(df[answer_column])
+    counted = (group_codes >= 0) & (answer_codes >= 0)
+    counts = np.bincount(group_codes[counted] * len(answers) + answer_codes[counted],
+                         minlength=len(groups) * len(answers))
+    counts = counts.reshape(len(groups), len(answers))
+    return {
+        'x_labels': groups.tolist(),
+        'bars_labels': answers.tolist(),
+        # one list of counts per answer, by group
+        'bars_data': [counts[:, j].tolist() for j in range(len(answers))],
+    }
+
+
+def get_bar_chart_data(df, groups, group_column, answers, answer_column):
+    """plot_utils.get_bar_chart_data, computed by bar_chart_data.
+
+    A new dict is returned, the caller can add a title or labels to it.
+    """
+    return bar_chart_data(df, groups, group_column, answers, answer_column)
@@ -0,0 +1,171 @@
+"""Compiled codebook of the survey.
+
+codebook.xlsx has one sheet per section of the questionnaire, with one row per
+variable: its name (Variable), its label (Label), the number of answers (Obs)
+and, for coded questions, the labels of the answers (VALUE_LABELS_COLUMN).
+load_codebook parses all the section sheets once, in parallel, and stores
+them as a compact JSON dictionary in the data cache:
+
+    {variable: {'section': ..., 'label': ..., 'obs': ..., 'values': {code: label}}}
+
+The next loads read that file, until codebook.xlsx changes. During a build
+(build_book.py), each kernel uses at most its share of the CPUs
+(MTF_KERNEL_CPUS), and parses the sheets one after the other when the
+notebooks already run one per CPU.
+
+    codebook = load_codebook('../Rwanda/references/codebook.xlsx')
+    codebook.label('I31_3')
+    codebook.choices('I31')       # ['I31_1', 'I31_2', ...]
+"""
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from data_cache import (CACHE_DIR, _module_fingerprints, _read_json, _same_code, _write_atomic,
+                        _write_json, file_fingerprint)
+
+# column of a section sheet holding the labels of the coded answers, when the
+# sheet has coded questions
+VALUE_LABELS_COLUMN = 'Value labels'
+
+# "1 = Yes; 2 = No", or one "1 Yes" per line
+_VALUE_LABEL = re.compile(r'^\s*(-?\d+)\s*[=:.)-]?\s*(.+?)\s*$')
+
+
+def parse_value_labels(text):
+    """Return {code: label} from the text of a value labels cell."""
+    if not isinstance(text, str):
+        return {}
+    values = {}
+    for part in re.split(r'[;\n]', text):
+        match = _VALUE_LABEL.match(part)
+        if match:
+            values[match.group(1)] = match.group(2)
+    return values
+
+
+def _obs(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_sheet(path, sheet):
+    """Return {variable: entry} for one section sheet of the codebook."""
+    df = pd.read_excel(path, sheet_name=sheet, dtype=object)
+    if 'Variable' not in df.columns:
+        return {}
+    # matched on the header of the sheet, whatever the case and spacing
+    value_column = next((c for c in df.columns if isinstance(c, str)
+                         and ' '.join(c.split()).lower() == VALUE_LABELS_COLUMN.lower()), None)
+    entries = {}
+    for record in df.to_dict('records'):
+        variable = record['Variable']
+        if not isinstance(variable, str) or not variable:
+            continue
+        label = record.get('Label')
+        entries[variable] = {
+            'section': sheet,
+            'label': label if isinstance(label, str) else None,
+            'obs': _obs(record.get('Obs')),
+            # None when the sheet has no value labels column
+            'values': parse_value_labels(record.get(value_column)) if value_column else None,
+        }
+    return entries
+
+
+def default_workers(n_tasks):
+    """Number of processes for n_tasks, within the CPUs left to this kernel by a build."""
+    cpus = int(os.environ.get('MTF_KERNEL_CPUS', os.cpu_count() or 1))
+    return max(1, min(n_tasks, cpus))
+
+
+def compile_codebook(path, workers=None):
+    """Parse all the section sheets of the codebook, in up to workers processes."""
+    # the worker processes are not seen by the audit hook of build_book
+    sys.audit('data_cache.read', os.path.abspath(path))
+    sheets = pd.ExcelFile(path).sheet_names
+    sheets = [s for s in sheets if s.startswith('Section')] or sheets
+    if workers is None:
+        workers = default_workers(len(sheets))
+    entries = {}
+    if workers == 1:
+        for sheet in sheets:
+            entries.update(parse_sheet(path, sheet))
+        return entries
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for parsed in pool.map(parse_sheet, [path] * len(sheets), sheets):
+            entries.update(parsed)
+    return entries
+
+
+def _cache_path(path):
+    return os.path.join(CACHE_DIR, 'codebook_%s.json'
+                        % re.sub(r'\W', '_', os.path.abspath(path)).strip('_'))
+
+
+def load_codebook(path, workers=None):
+    """Return the Codebook of path, compiled once and then read from the cache."""
+    # lets build_book know that path is read, even when it is served from the cache
+    sys.audit('data_cache.read', os.path.abspath(path))
+    cache_file = _cache_path(path)
+    cached = _read_json(cache_file)
+    fingerprint = file_fingerprint(path, cached and cached['fingerprint'])
+    # a new version of this module may parse the sheets differently
+    code = _module_fingerprints([sys.modules[__name__]], cached and cached.get('code'))
+    if (cached is not None and cached['fingerprint']['sha256'] == fingerprint['sha256']
+            and _same_code(code, cached.get('code'))):
+        return Codebook(cached['entries'])
+
+    entries = compile_codebook(path, workers)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    _write_atomic(cache_file, _write_json({'fingerprint': fingerprint, 'code': code,
+                                           'entries': entries}))
+    return Codebook(entries)
+
+
+class Codebook:
+    """Labels, value labels and number of answers of the variables of the survey."""
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    def __contains__(self, variable):
+        return variable in self.entries
+
+    def label(self, variable):
+        """Label of variable, None when the codebook has none."""
+        return self.entries[variable]['label']
+
+    def obs(self, variable):
+        """Number of answers to variable."""
+        return self.entries[variable]['obs']
+
+    def value_labels(self, variable):
+        """{coded answer: label} of variable.
+
+        Raises ValueError when the sheet of variable has no value labels column.
+        """
+        entry = self.entries[variable]
+        if entry['values'] is None:
+            raise ValueError("the codebook sheet %r has no %r column: the labels of the "
+                             "answers to %s are unknown"
+                             % (entry['section'], VALUE_LABELS_COLUMN, variable))
+        return {int(code): label for code, label in entry['values'].items()}
+
+    def labels(self):
+        """{variable: label} of all the variables having a label."""
+        return {v: e['label'] for v, e in self.entries.items() if e['label'] is not None}
+
+    def variables(self, section=None):
+        """Variables of the codebook (of one section sheet, e.g. 'Section I'), in order."""
+        return [v for v, e in self.entries.items() if section is None or e['section'] == section]
+
+    def choices(self, question):
+        """Variables of the choices of a multiple choice question (question_<k>), in order."""
+        pattern = re.compile(r'^%s_\d+$' % re.escape(question))
+        return [v for v in self.entries if pattern.match(v)]
@@ -0,0 +1,70 @@
+"""Compact dtypes for the survey datasets.
+
+Coded answers (C182 = 1..8, 40, 555, R8 = 1..5, yes/no = 1/2...) are read as
+float64 because of the missing answers, and text columns such as Province,
+District or Village as Python strings. compact_dtypes stores:
+
+- columns of whole numbers as the smallest nullable integer type (Int8,
+  Int16...), missing answers being <NA>;
+- the administrative areas, and text columns with few distinct values, as
+  categoricals.
+
+A compacted main dataset takes several times less memory, and filters such as
+main[question] == 1 compare small integers instead of floats or strings.
+Missing values behave as before: they are not equal to any answer, and
+to_numpy(dtype=float) turns them back into NaN.
+"""
+import numpy as np
+import pandas as pd
+
+# always stored as categoricals
+ADMIN_AREAS = ['Province', 'District', 'Sector', 'Cell', 'Village']
+
+# text columns with at most this share of distinct values become categoricals
+MAX_CATEGORY_RATIO = 0.5
+
+_INTEGER_TYPES = [(np.int8, 'Int8'), (np.int16, 'Int16'), (np.int32, 'Int32'), (np.int64, 'Int64')]
+
+
+def integer_dtype(low, high, nullable=True):
+    """Smallest integer dtype holding low..high."""
+    for numpy_type, nullable_type in _INTEGER_TYPES:
+        info = np.iinfo(numpy_type)
+        if info.min <= low and high <= info.max:
+            return nullable_type if nullable else np.dtype(numpy_type)
+    return None
+
+
+def compact_column(values, categories=False):
+    """Return values with a compact dtype, or values itself when there is none."""
+    if pd.api.types.is_bool_dtype(values.dtype):
+        return values
+    if pd.api.types.is_integer_dtype(values.dtype) and not isinstance(values.dtype, pd.CategoricalDtype):
+        if len(values) == 0:
+            return values
+        dtype = integer_dtype(values.min(), values.max(), nullable=values.hasnans)
+        return values.astype(dtype) if dtype is not None else values
+    if pd.api.types.is_float_dtype(values.dtype):
+        known = values.dropna().to_numpy()
+        if len(known) == 0 or not np.array_equal(known, np.round(known)):
+            return values
+        dtype = integer_dtype(known.min(), known.max())
+        return values.astype(dtype) if dtype is not None else values
+    if pd.api.types.is_object_dtype(values.dtype) or pd.api.types.is_string_dtype(values.dtype):
+        known = values.dropna()
+        if not known.map(lambda v: isinstance(v, str)).all():
+            return values
+        if categories or known.nunique() <= MAX_CATEGORY_RATIO * len(values):
+            return values.astype('category')
+    return values
+
+
+def compact_dtypes(df, categories=ADMIN_AREAS):
+    """Return df with compact dtypes; the columns of categories become categoricals."""
+    return pd.DataFrame({column: compact_column(df[column], column in categories)
+                         for column in df.columns}, index=df.index)
+
+
+def memory_usage(df):
+    """Memory used by df, in bytes, including the Python strings."""
+    return int(df.memory_usage(deep=True).sum())
@@ -0,0 +1,64 @@
+"""Counts of households over several dimensions, computed in one pass.
+
+The shares shown in the chapters (per main source, per habitat, per tier...)
+used to be computed by filtering the whole dataset once per answer and once per
+habitat. A CountCube groups the dataset once over all the dimensions of
+interest; totals, urban/rural splits and percentages are then read from the
+(small) table of counts.
+
+    cube = CountCube(main, [main_source_question, 'habitat'])
+    cube.counts(main_source_question, [1, 2, 3])
+    cube.percent(main_source_question, [1, 2, 3], where={'habitat': 'urban'})
+"""
+import numpy as np
+import pandas as pd
+
+
+class CountCube:
+    """Number of rows of df for each combination of values of dimensions.
+
+    Empty values (NaN) are counted as a value of their own, so that totals
+    include the households that did not answer.
+    """
+
+    def __init__(self, df, dimensions):
+        self.dimensions = list(dimensions)
+        self.table = df.groupby(self.dimensions, dropna=False, observed=True).size()
+        if len(self.dimensions) == 1:
+            self.table.index = pd.MultiIndex.from_arrays([self.table.index],
+                                                         names=self.dimensions)
+
+    def _select(self, where):
+        table = self.table
+        for dimension, value in (where or {}).items():
+            if dimension not in self.dimensions:
+                raise KeyError('%s is not a dimension of the cube' % dimension)
+            level = table.index.get_level_values(dimension)
+            if isinstance(value, (list, tuple, set, np.ndarray)):
+                table = table[level.isin(list(value))]
+            else:
+                table = table[level == value]
+        return table
+
+    def total(self, where=None):
+        """Number of rows matching where ({dimension: value or list of values})."""
+        return int(self._select(where).sum())
+
+    def counts(self, dimension, values, where=None):
+        """List of the number of rows having each of values for dimension."""
+        table = self._select(where)
+        counts = table.groupby(level=dimension, dropna=False).sum()
+        return [int(c) for c in counts.reindex(values, fill_value=0)]
+
+    def percent(self, dimension, values, where=None, of=None):
+        """List of the percentage of rows having each of values for dimension.
+
+        Percentages are relative to all rows matching where or, when of is a
+        list of values, to the rows having one of them for dimension.
+        """
+        counts = self.counts(dimension, values, where)
+        if of is None:
+            total = self.total(where)
+        else:
+            total = sum(self.counts(dimension, of, where))
+        return [100*c/total for c in counts]
@@ -0,0 +1,293 @@
+"""On-disk columnar cache for the raw survey files.
+
+Parsing main.xlsx is the slowest step of the Rwanda chapters, and every chapter
+reads it again. The first read converts the workbook into a Parquet file stored
+in _build/.data_cache/; the following reads load that file instead.
+
+A cache entry is invalidated when its source file changes, or the source of
+one of the modules its reader depends on (e.g. the rules of the derived
+columns): the modification time and size are checked first, and the content
+hash (sha256) is only computed again when they differ, so touching a file
+without changing it does not force a new parse.
+
+Parquet stores each column separately: cached_read can load a subset of the
+columns only, which keeps the memory used by a chapter low.
+
+During a parallel build (build_book.py --shared-data), the entries in use
+(whose source and code did not change) are also published once as
+uncompressed Arrow files in shared memory (/dev/shm), in the directory given
+by the MTF_SHARED_DATA environment variable. The kernels then memory-map these
+files instead of decoding the Parquet files: the data is neither parsed nor
+decompressed again. Only the columns of plain numeric types without missing
+values are used in place by pandas, their pages being shared by all the
+kernels; the other columns (the nullable integers and categoricals of
+compact_dtypes, text, columns with missing values) are converted, so copied,
+in each kernel.
+
+prune_cache removes the entries which are no longer in use, as build_book.py
+does before each build.
+"""
+import hashlib
+import inspect
+import json
+import os
+import sys
+import warnings
+
+import pandas as pd
+
+BOOK_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# can be changed with the MTF_DATA_CACHE environment variable
+CACHE_DIR = os.environ.get('MTF_DATA_CACHE',
+                           os.path.join(BOOK_ROOT, '_build', '.data_cache'))
+
+# set by build_book.py --shared-data
+SHARED_DIR = os.environ.get('MTF_SHARED_DATA')
+
+
+def file_hash(path, block_size=1 << 20):
+    """Return the sha256 of the content of path."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_fingerprint(path, previous=None):
+    """Return a dict identifying the current version of path.
+
+    If previous (an older fingerprint) has the same modification time and size,
+    its hash is reused instead of reading the file again.
+    """
+    stat = os.stat(path)
+    fingerprint = {'mtime': stat.st_mtime, 'size': stat.st_size}
+    if previous is not None and all(previous.get(k) == v for k, v in fingerprint.items()):
+        fingerprint['sha256'] = previous['sha256']
+    else:
+        fingerprint['sha256'] = file_hash(path)
+    return fingerprint
+
+
+def module_paths(modules):
+    """Paths of the source files of modules."""
+    return [os.path.abspath(inspect.getsourcefile(m) or m.__file__) for m in modules]
+
+
+def _module_fingerprints(modules, previous):
+    previous = previous or {}
+    return {p: file_fingerprint(p, previous.get(p)) for p in module_paths(modules)}
+
+
+def _same_code(code, previous):
+    return (previous is not None and set(code) == set(previous)
+            and all(f['sha256'] == previous[p]['sha256'] for p, f in code.items()))
+
+
+def _entry_paths(path, reader_name, kwargs):
+    key = json.dumps([os.path.abspath(path), reader_name, kwargs],
+                     sort_keys=True, default=str)
+    name = hashlib.sha1(key.encode()).hexdigest()
+    base = os.path.join(CACHE_DIR, name)
+    return base + '.parquet', base + '.json'
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(data):
+    def write(path):
+        with open(path, 'w') as f:
+            json.dump(data, f)
+    return write
+
+
+def _write_atomic(path, write):
+    # several notebooks may fill the cache at the same time
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def cached_columns(data_file):
+    """Return the names of the columns stored in a Parquet file, without reading it."""
+    import pyarrow.parquet as pq
+    names = pq.ParquetFile(data_file).schema_arrow.names
+    return [n for n in names if not n.startswith('__index_level_')]
+
+
+def shared_path(data_file, shared_dir=None):
+    """Path of the Arrow file of the cache entry data_file in shared memory."""
+    name = os.path.splitext(os.path.basename(data_file))[0]
+    return os.path.join(shared_dir or SHARED_DIR, name + '.arrow')
+
+
+def _entry_in_use(meta):
+    """Whether the files a cache entry was built from are still there and unchanged.
+
+    The ODK stores of odk_cache.py ('files') are extended when their results
+    files grow, so only the existence of these files is checked.
+    """
+    fingerprints = dict(meta.get('code') or {})
+    if 'source' in meta:
+        fingerprints[meta['source']] = meta
+    try:
+        return (all(file_fingerprint(p, f)['sha256'] == f['sha256']
+                    for p, f in fingerprints.items())
+                and all(os.path.isfile(p) for p in meta.get('files', {})))
+    except OSError:
+        return False
+
+
+def cache_entries():
+    """Return [(meta, data files)] for the entries of the cache, with their paths.
+
+    Data files without a valid meta file come last, with meta None. The other
+    files of the cache (codebooks, figures...) are not listed.
+    """
+    if not os.path.isdir(CACHE_DIR):
+        return []
+    names = sorted(os.listdir(CACHE_DIR))
+    orphans = [n for n in names if n.endswith(('.parquet', '.pkl'))]
+    entries = []
+    for name in names:
+        meta = _read_json(os.path.join(CACHE_DIR, name)) if name.endswith('.json') else None
+        if not isinstance(meta, dict) or not ('source' in meta or 'files' in meta):
+            continue
+        base = name[:-len('.json')]
+        files = [n for n in orphans if n.startswith((base + '.', base + '_'))]
+        orphans = [n for n in orphans if n not in files]
+        entries.append((meta, [os.path.join(CACHE_DIR, n) for n in [name] + files]))
+    entries.extend((None, [os.path.join(CACHE_DIR, n)]) for n in orphans)
+    return entries
+
+
+def prune_cache():
+    """Remove the cache entries which are no longer in use, and the orphan data files.
+
+    Returns the paths of the removed files.
+    """
+    removed = []
+    for meta, files in cache_entries():
+        if meta is None or not _entry_in_use(meta):
+            for path in files:
+                try:
+                    os.remove(path)
+                    removed.append(path)
+                except OSError:
+                    pass
+    return removed
+
+
+def share_cache(shared_dir):
+    """Publish the Parquet files of the entries in use as Arrow files in shared_dir.
+
+    Returns the number of bytes published.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    size = 0
+    for meta, files in cache_entries():
+        if meta is None or not _entry_in_use(meta):
+            continue
+        for data_file in files:
+            if not data_file.endswith('.parquet'):
+                continue
+            table = pq.read_table(data_file)
+            path = shared_path(data_file, shared_dir)
+            with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            size += os.path.getsize(path)
+    return size
+
+
+def read_entry(data_file, columns=None):
+    """Read the columns of a Parquet cache entry, from shared memory when published.
+
+    Only the numeric columns without missing values of a shared entry are not
+    copied (see the module docstring).
+    """
+    if SHARED_DIR:
+        path = shared_path(data_file)
+        # an entry written again during the build is newer than its shared copy,
+        # which is removed (the kernels having mapped it keep their mapping)
+        if os.path.exists(path) and os.path.getmtime(path) < os.path.getmtime(data_file):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        if os.path.exists(path):
+            import pyarrow as pa
+            table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+            if columns is not None:
+                # the stored index (e.g. the household of the ODK tables) is kept
+                index = [c for c in (table.schema.pandas_metadata or {}).get('index_columns', [])
+                         if isinstance(c, str) and c not in columns]
+                table = table.select(list(columns) + index)
+            return table.to_pandas(split_blocks=True)
+    return pd.read_parquet(data_file, columns=columns)
+
+
+def _projection(columns, available):
+    if columns is None:
+        return None
+    return list(columns(available) if callable(columns) else columns)
+
+
+def cached_read(path, reader, columns=None, modules=(), **kwargs):
+    """Read path with reader(path, **kwargs), going through the columnar cache.
+
+    columns restricts the result to a list of columns, or is a function
+    returning that list from the list of all the columns. Only these columns
+    are read from the cache. The entry is also invalidated when the source of
+    one of modules, the modules reader depends on, changes.
+    """
+    # lets build_book know that path is read, even when it is served from the cache
+    sys.audit('data_cache.read', os.path.abspath(path))
+    data_file, meta_file = _entry_paths(path, reader.__name__, kwargs)
+    meta = _read_json(meta_file)
+    fingerprint = file_fingerprint(path, meta)
+    code = _module_fingerprints(modules, meta and meta.get('code'))
+
+    if (meta is not None and meta['sha256'] == fingerprint['sha256']
+            and _same_code(code, meta.get('code')) and os.path.exists(data_file)):
+        df = read_entry(data_file, _projection(columns, cached_columns(data_file)))
+        if meta['mtime'] != fingerprint['mtime'] or meta['code'] != code:
+            # same contents, new mtimes: avoid hashing the files next time
+            meta.update(fingerprint, code=code)
+            _write_atomic(meta_file, _write_json(meta))
+        return df
+
+    df = reader(path, **kwargs)
+    projection = _projection(columns, list(df.columns))
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    try:
+        _write_atomic(data_file, df.to_parquet)
+    except Exception as e:
+        # e.g. columns mixing numbers and text cannot be stored in Parquet
+        warnings.warn('%s is not cached: %s' % (path, e))
+        return df if projection is None else df[projection]
+    meta = dict(fingerprint, source=os.path.abspath(path), code=code)
+    _write_atomic(meta_file, _write_json(meta))
+    return df if projection is None else df[projection]
+
+
+def cached_read_excel(path, **kwargs):
+    """pd.read_excel(path, **kwargs), served from the columnar cache when possible."""
+    return cached_read(path, pd.read_excel, **kwargs)
+
+
+def cached_read_csv(path, **kwargs):
+    """pd.read_csv(path, **kwargs), served from the columnar cache when possible."""
+    return cached_read(path, pd.read_csv, **kwargs)
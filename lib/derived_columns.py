@@ -0,0 +1,32 @@
+"""Columns derived from the answers of the survey, written as data.
+
+Each entry maps the name of a derived column to the question it is computed
+from, a 'map' {coded answer: value} and the 'default' value given to any other
+answer (or to no answer). survey_data.read_main adds these columns when the
+dataset is loaded, so they are stored in the columnar cache with the answers
+and no chapter computes them again.
+"""
+
+# B5: answers 1-3 are rural habitats, answers 4-6 urban ones
+HABITAT = {
+    'question': 'B5_What is the type of habitat',
+    'map': {1: 'rural', 2: 'rural', 3: 'rural', 4: 'urban', 5: 'urban', 6: 'urban'},
+    'default': 'other',
+}
+
+DERIVED_COLUMNS = {
+    'habitat': HABITAT,
+}
+
+
+def derive_column(df, rule):
+    """Return the derived column of df for rule, as a Series."""
+    values = df[rule['question']].map(rule['map'])
+    return values.where(values.notna(), rule.get('default')).astype(object)
+
+
+def add_derived_columns(df, columns=DERIVED_COLUMNS):
+    """Add the derived columns {name: rule} to df (in place) and return it."""
+    for name, rule in columns.items():
+        df[name] = derive_column(df, rule)
+    return df
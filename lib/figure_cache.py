@@ -0,0 +1,257 @@
+"""Memoized charts.
+
+memoize_figure wraps a plotting function (plot_utils.stacked_bar_chart,
+plot_bars, mfi.tier_barh...) drawing one matplotlib figure. The rendered
+figure is stored as PNG in _build/.data_cache/figures/, keyed by a fingerprint
+of the arguments of the call (the values of the DataFrames, Series and arrays,
+the pickle of the other arguments), the attributes of the object of a method
+(e.g. the households and offices of an mfi), the matplotlib settings
+(rcParams), the working directory and the modification time of the module of
+the function. A chart drawn again with the same data and style, in the next
+build, is displayed from the stored PNG instead of being rendered by
+matplotlib:
+
+    stacked_bar_chart = memoize_figure(stacked_bar_chart)
+    mfi.tier_barh = memoize_figure(mfi.tier_barh)
+
+depends returns other data the function reads besides its arguments and its
+object, e.g. module globals. The displayed figure is memoized, with the value
+returned by the function and the files it writes (figure_name, the outputs of
+mfi.setPathBook...), which are written again when the call is reused. Figures
+closed by plt.show() in the function are captured when it is called. Calls
+whose data cannot be fingerprinted (e.g. DataFrames holding lists), calls
+drawing no figure, or several, and calls returning matplotlib objects (which
+cannot be returned without drawing the figure again) are not cached.
+"""
+import functools
+import hashlib
+import inspect
+import io
+import os
+import pickle
+import sys
+
+import numpy as np
+import pandas as pd
+
+from data_cache import CACHE_DIR
+
+FIGURE_CACHE_DIR = os.path.join(CACHE_DIR, 'figures')
+
+
+def _fingerprint(value, h):
+    """Add value to the hash h.
+
+    Raises TypeError (or pickle.PicklingError) when value cannot be
+    fingerprinted, such as a DataFrame holding lists.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        h.update(repr((type(value).__name__, getattr(value, 'name', None),
+                       list(getattr(value, 'columns', [])))).encode())
+        h.update(pd.util.hash_pandas_object(value, index=not isinstance(value, pd.Index))
+                 .to_numpy().tobytes())
+    elif isinstance(value, np.ndarray) and value.dtype != object:
+        h.update(repr((value.dtype.str, value.shape)).encode())
+        h.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        h.update(b'{')
+        for k, v in value.items():
+            _fingerprint(k, h)
+            _fingerprint(v, h)
+        h.update(b'}')
+    elif isinstance(value, (list, tuple)):
+        h.update(b'[')
+        for v in value:
+            _fingerprint(v, h)
+        h.update(b']')
+    elif value is None or isinstance(value, (str, bytes, bool, int, float)):
+        h.update(repr(value).encode())
+    else:
+        # the repr of arrays, Series or other objects may be shortened
+        h.update(type(value).__qualname__.encode())
+        h.update(pickle.dumps(value, protocol=4))
+
+
+def _function_key(plot):
+    module = sys.modules.get(plot.__module__)
+    path = getattr(module, '__file__', None)
+    owner = getattr(plot, '__self__', None)
+    return [plot.__module__, type(owner).__name__ if owner is not None else None,
+            plot.__qualname__, os.path.getmtime(path) if path and os.path.isfile(path) else None]
+
+
+def _owner_state(plot):
+    """Data attributes of the object of the method plot, {} for a function."""
+    if not inspect.ismethod(plot) or not hasattr(plot.__self__, '__dict__'):
+        return {}
+    return {name: value for name, value in sorted(vars(plot.__self__).items())
+            if not callable(value)}
+
+
+def figure_key(plot, args, kwargs, depends=()):
+    """Return the key of the figure drawn by plot(*args, **kwargs).
+
+    Raises TypeError (or pickle.PicklingError) when the data of the call
+    cannot be fingerprinted.
+    """
+    import matplotlib
+
+    h = hashlib.sha1()
+    _fingerprint(_function_key(plot), h)
+    _fingerprint([args, kwargs, _owner_state(plot), list(depends), os.getcwd()], h)
+    _fingerprint(sorted((k, v) for k, v in matplotlib.rcParams.items()), h)
+    return h.hexdigest()
+
+
+# files opened for writing by the memoized calls running, innermost last
+_writing = []
+
+
+def _record_write(event, args):
+    if event != 'open' or not _writing or not isinstance(args[0], (str, bytes, os.PathLike)):
+        return
+    mode, flags = args[1], args[2]
+    if (isinstance(mode, str) and set(mode) & set('wax+')
+            or mode is None and flags & (os.O_WRONLY | os.O_RDWR)):
+        for written in _writing:
+            written.add(os.path.abspath(os.fsdecode(args[0])))
+
+
+sys.addaudithook(_record_write)
+
+
+def _written_files(paths):
+    """{path: content} of the files written by a call, None when one cannot be read."""
+    files = {}
+    for path in sorted(paths):
+        if path.startswith(FIGURE_CACHE_DIR + os.sep):
+            continue
+        try:
+            with open(path, 'rb') as f:
+                files[path] = f.read()
+        except OSError:
+            return None
+    return files
+
+
+def _restore(files):
+    for path, content in files.items():
+        try:
+            with open(path, 'rb') as f:
+                if f.read() == content:
+                    continue
+        except OSError:
+            pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+
+
+def _save(path, content):
+    os.makedirs(FIGURE_CACHE_DIR, exist_ok=True)
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(content)
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+class _ResultPickler(pickle.Pickler):
+    def persistent_id(self, obj):
+        from matplotlib.artist import Artist
+        if isinstance(obj, Artist):
+            raise pickle.PicklingError('%s is a matplotlib object' % type(obj).__name__)
+        return None
+
+
+def _dump_result(result, files):
+    """The pickle of result and files, None when it cannot be stored."""
+    buffer = io.BytesIO()
+    try:
+        _ResultPickler(buffer).dump((result, files))
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return None
+    return buffer.getvalue()
+
+
+def _load(result_path, png_path):
+    """(result, files, png) of a stored call, None when it is not cached."""
+    try:
+        with open(result_path, 'rb') as f:
+            result, files = pickle.load(f)
+        with open(png_path, 'rb') as f:
+            return result, files, f.read()
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError,
+            TypeError, ValueError):
+        return None
+
+
+def _png(figure):
+    buffer = io.BytesIO()
+    # as the inline backend of the notebooks renders it
+    figure.savefig(buffer, format='png', bbox_inches='tight')
+    return buffer.getvalue()
+
+
+def _show(png):
+    from IPython.display import Image, display
+    display(Image(data=png, format='png'))
+
+
+def memoize_figure(plot, depends=None):
+    """Return plot, with its figure memoized (see the module docstring)."""
+    @functools.wraps(plot)
+    def memoized(*args, **kwargs):
+        import matplotlib.pyplot as plt
+
+        try:
+            key = figure_key(plot, args, kwargs, depends() if depends is not None else ())
+        except (TypeError, pickle.PicklingError):
+            return plot(*args, **kwargs)
+        path = os.path.join(FIGURE_CACHE_DIR, key + '.png')
+        result_path = os.path.join(FIGURE_CACHE_DIR, key + '.pickle')
+        entry = _load(result_path, path)
+        if entry is not None:
+            result, files, png = entry
+            _restore(files)
+            _show(png)
+            return result
+
+        # plt.show() would display and close the figure before it is stored
+        before = set(plt.get_fignums())
+        shown = []
+
+        def show(*args, **kwargs):
+            for number in plt.get_fignums():
+                if number not in before:
+                    shown.append(_png(plt.figure(number)))
+                    plt.close(number)
+
+        original_show, plt.show = plt.show, show
+        _writing.append(set())
+        try:
+            result = plot(*args, **kwargs)
+        finally:
+            plt.show = original_show
+            written = _writing.pop()
+        new = [n for n in plt.get_fignums() if n not in before]
+        files = _written_files(written)
+        pickled = _dump_result(result, files) if files is not None else None
+        if len(shown) + len(new) != 1 or pickled is None:
+            for png in shown:
+                _show(png)
+            return result
+        if new:
+            figure = plt.figure(new[0])
+            shown.append(_png(figure))
+            plt.close(figure)
+        png = shown[0]
+        _save(result_path, pickled)
+        _save(path, png)
+        _show(png)
+        return result
+
+    return memoized
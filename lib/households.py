@@ -0,0 +1,54 @@
+"""Join of the section tables with the households of the main dataset.
+
+The section tables (I.csv...) have one row per stove, member or appliance,
+with the identifier of its household in HHID; main has one row per household,
+identified by 'Household Identification'. A HouseholdIndex is a hash index of
+the identifiers of main, built once and shared by all the sections: the
+household attributes of any number of rows are attached with a single
+lookup, whatever the order of the rows.
+
+    households = HouseholdIndex(main)
+    stoves = households.attach(section_I, ['habitat'])
+"""
+import numpy as np
+import pandas as pd
+
+# identifier of the household in main, and in the section tables
+MAIN_KEY = 'Household Identification'
+SECTION_KEY = 'HHID'
+
+
+class HouseholdIndex:
+    """Position of each household of main, by identifier."""
+
+    def __init__(self, main, key=MAIN_KEY):
+        self.main = main
+        self.key = key
+        self.index = pd.Index(main[key].to_numpy())
+        if not self.index.is_unique:
+            raise ValueError('%s does not identify the households: it has duplicates' % key)
+
+    def __len__(self):
+        return len(self.index)
+
+    def positions(self, keys):
+        """Position in main of the households keys, -1 for the unknown ones."""
+        return self.index.get_indexer(np.asarray(keys))
+
+    def _take(self, column, positions):
+        return pd.api.extensions.take(self.main[column].array, positions, allow_fill=True)
+
+    def lookup(self, keys, column):
+        """Values of column of main for the households keys (missing for unknown ones)."""
+        return pd.Series(self._take(column, self.positions(keys)), name=column)
+
+    def attach(self, rows, columns, key=SECTION_KEY):
+        """Return a copy of rows with the columns of main of the household of each row.
+
+        Rows of households which are not in main get missing values.
+        """
+        positions = self.positions(rows[key])
+        attached = rows.copy()
+        for column in columns:
+            attached[column] = self._take(column, positions)
+        return attached
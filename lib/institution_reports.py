@@ -0,0 +1,195 @@
+"""Render the HIT chapters of several institutions in one command.
+
+The general, mtf and dummy chapters (in electricity/ and cooking/) only differ
+by the institution they report on: the first code cell sets institution_id,
+and the path of the ODK results in mfi.odk_data_name. This script executes
+such template chapters for a list of institutions, in a pool of processes,
+with these two parameters replaced, and writes the executed notebooks (and,
+with --html, their HTML page) into _build/reports/institution_<id>/:
+
+    python lib/institution_reports.py 7 5:../../../ODK_Collect_Data/TeCreemos/ENCUESTA_ENERGIA_TC/ENCUESTA_ENERGIA_TC_results.csv
+    python lib/institution_reports.py --html 7:../../../ODK_Collect_Data/Apide/Data/SDG7/results.csv
+    python lib/institution_reports.py -t electricity/mtf.ipynb 7
+
+The ODK results of the templates are those of their own institution: the path
+of the results (relative to the template) is required for any other
+institution, and the command fails before rendering anything without it.
+
+Each report runs in its own kernel, so the reports share their data through
+the data cache of the book: the ODK results stores of lib/odk_cache.py, and
+the charts memoized by lib/figure_cache.py, are computed by the first report
+needing them and read from _build/.data_cache/ by all the others. The time and
+error of each report are saved in _build/reports/reports.json.
+"""
+import argparse
+import copy
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from build_book import BOOK_ROOT, BUILD_DIR, read_yaml, run_notebook
+
+REPORTS_DIR = os.path.join(BUILD_DIR, 'reports')
+SUMMARY_FILE = os.path.join(REPORTS_DIR, 'reports.json')
+
+# chapters rendered by default, relative to the book
+TEMPLATES = ['electricity/general.ipynb', 'cooking/general.ipynb']
+
+_INSTITUTION_ID = re.compile(r'^institution_id\s*=\s*(.*?)\s*$', re.MULTILINE)
+_ODK_DATA_NAME = re.compile(r'^mfi\.odk_data_name\s*=.*$', re.MULTILINE)
+
+
+def parse_institution(text):
+    """Return (institution_id, odk_data_name or None) from 'id' or 'id:path'."""
+    institution_id, _, odk_data_name = text.partition(':')
+    return int(institution_id), odk_data_name or None
+
+
+def template_institution(nb):
+    """The institution_id set by the notebook nb."""
+    for cell in nb.cells:
+        match = cell.cell_type == 'code' and _INSTITUTION_ID.search(cell.source)
+        if match:
+            return int(match.group(1))
+    raise ValueError('the notebook does not set institution_id')
+
+
+def parametrize(nb, institution_id, odk_data_name=None):
+    """Set institution_id (and mfi.odk_data_name) in the code cells of nb, in place.
+
+    Raises ValueError when institution_id is not the institution of nb and
+    odk_data_name is not given: nb would read the results of its own
+    institution.
+    """
+    template_id = template_institution(nb)
+    if odk_data_name is None and institution_id != template_id:
+        raise ValueError('the ODK results of institution %d are needed (%d:path), the template '
+                         'reads those of institution %d' % (institution_id, institution_id,
+                                                            template_id))
+    found = odk_data_name is None
+    for cell in nb.cells:
+        if cell.cell_type != 'code':
+            continue
+        source = _INSTITUTION_ID.sub('institution_id = %d' % institution_id, cell.source)
+        if odk_data_name is not None:
+            source, count = _ODK_DATA_NAME.subn('mfi.odk_data_name = %r' % odk_data_name, source)
+            found = found or count > 0
+        cell.source = source
+    if not found:
+        raise ValueError('the notebook does not set mfi.odk_data_name')
+    return nb
+
+
+def check_reports(institutions, templates):
+    """Raise ValueError when a template cannot be rendered for one of institutions."""
+    import nbformat
+
+    for template in templates:
+        nb = nbformat.read(os.path.join(BOOK_ROOT, template), as_version=4)
+        for institution_id, odk_data_name in institutions:
+            try:
+                parametrize(copy.deepcopy(nb), institution_id, odk_data_name)
+            except ValueError as e:
+                raise ValueError('%s: %s' % (template, e))
+
+
+def report_path(institution_id, template, extension='.ipynb'):
+    return os.path.join(REPORTS_DIR, 'institution_%d' % institution_id,
+                        os.path.splitext(template)[0] + extension)
+
+
+def write_html(nb, path):
+    from nbconvert import HTMLExporter
+
+    body, _ = HTMLExporter().from_notebook_node(nb)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(body)
+
+
+def render_report(institution_id, odk_data_name, template, timeout, allow_errors, html):
+    """Execute template for one institution and write the report.
+
+    The notebook runs in the directory of the template, so that its relative
+    paths (HIT sources, ODK results, lib/) are unchanged. Returns
+    (institution_id, template, seconds, error message or None).
+    """
+    import nbformat
+
+    full_path = os.path.join(BOOK_ROOT, template)
+    nb = parametrize(nbformat.read(full_path, as_version=4), institution_id, odk_data_name)
+    seconds, error, _, _ = run_notebook(nb, os.path.dirname(full_path), timeout, allow_errors)
+    if error is None:
+        path = report_path(institution_id, template)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        nbformat.write(nb, path)
+        if html:
+            write_html(nb, report_path(institution_id, template, '.html'))
+    return institution_id, template, seconds, error
+
+
+def render_reports(institutions, templates, config, workers, html=False):
+    """Render every template for every (institution_id, odk_data_name) of institutions.
+
+    Returns {institution_id: {template: {'seconds': ..., 'error': ...}}}.
+    """
+    settings = config.get('execute', {})
+    timeout = settings.get('timeout', 30)
+    allow_errors = settings.get('allow_errors', False)
+
+    reports = {institution_id: {} for institution_id, _ in institutions}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(render_report, institution_id, odk_data_name, template,
+                               timeout, allow_errors, html)
+                   for institution_id, odk_data_name in institutions
+                   for template in templates]
+        for future in as_completed(futures):
+            institution_id, template, seconds, error = future.result()
+            reports[institution_id][template] = {'seconds': round(seconds, 2), 'error': error}
+            print('%8.1fs  institution %d  %s%s'
+                  % (seconds, institution_id, template, '  FAILED' if error else ''))
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('institutions', nargs='+', type=parse_institution,
+                        help='institution ids, optionally followed by :path of the ODK results')
+    parser.add_argument('-t', '--template', action='append', dest='templates',
+                        help='chapter to render, relative to the book (default: %s); can be repeated'
+                        % ', '.join(TEMPLATES))
+    parser.add_argument('-w', '--workers', type=int,
+                        default=int(os.environ.get('MTF_BUILD_WORKERS', os.cpu_count() or 1)),
+                        help='number of reports rendered at the same time (default: number of CPUs)')
+    parser.add_argument('--html', action='store_true',
+                        help='also write the HTML page of each report')
+    args = parser.parse_args(argv)
+
+    config = read_yaml(os.path.join(BOOK_ROOT, '_config.yml'))
+    templates = args.templates or TEMPLATES
+    try:
+        check_reports(args.institutions, templates)
+    except ValueError as e:
+        parser.error(str(e))
+    workers = max(1, min(args.workers, len(args.institutions) * len(templates)))
+
+    start = time.perf_counter()
+    reports = render_reports(args.institutions, templates, config, workers, args.html)
+    wall_seconds = time.perf_counter() - start
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    with open(SUMMARY_FILE, 'w') as f:
+        json.dump({'workers': workers, 'wall_seconds': round(wall_seconds, 2),
+                   'reports': {str(i): r for i, r in reports.items()}}, f, indent=2)
+
+    failed = [(i, t, r['error']) for i, rs in reports.items() for t, r in rs.items() if r['error']]
+    print('%d reports rendered in %.1fs with %d workers, %d failed'
+          % (sum(len(r) for r in reports.values()), wall_seconds, workers, len(failed)))
+    for institution_id, template, error in failed:
+        print('institution %d, %s failed: %s' % (institution_id, template, error), file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
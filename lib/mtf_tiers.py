@@ -0,0 +1,342 @@
+"""Computation of the MTF tiers for the Rwanda dataset.
+
+The tier rules are written as data in tier_rules.py. compile_rules turns a rule
+set into a function evaluating every rule over whole columns: the answers of
+all households are read at once, the column matching the main source of each
+household is picked with a single lookup and the answers are binned into tiers.
+
+Columns are found through question_index.index_of, so rules can name them by
+their full name or by their code (e.g. 'C173b').
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import tier_rules
+from multiple_choice import selected
+from question_index import index_of
+from section_stream import CHUNKSIZE, aggregate_section
+
+MAIN_SOURCE_QUESTION = tier_rules.RWANDA_ELECTRICITY['source_question']
+
+
+def column_values(df, columns):
+    """Return the values of columns (codes or full names) of df as a float matrix."""
+    positions = index_of(df.columns).positions(columns)
+    return df.iloc[:, positions].to_numpy(dtype=float)
+
+
+def bin_tiers(values, bins, tiers):
+    """Convert values into tiers, with tiers[k] given to bins[k-1] <= value < bins[k].
+
+    NaN values stay NaN.
+    """
+    values = np.asarray(values, dtype=float)
+    result = np.asarray(tiers, dtype=float)[np.digitize(values, bins)]
+    result[np.isnan(values)] = np.nan
+    return result
+
+
+def map_tiers(values, mapping):
+    """Convert coded answers into tiers with mapping; other answers become NaN."""
+    values = np.asarray(values, dtype=float)
+    answers = np.array(sorted(mapping), dtype=float)
+    tiers = np.array([mapping[a] for a in sorted(mapping)], dtype=float)
+    pos = np.clip(np.searchsorted(answers, values), 0, len(answers) - 1)
+    return np.where(answers[pos] == values, tiers[pos], np.nan)
+
+
+class ColumnLookup:
+    """Pick, for each household, the column matching its answer to a source question."""
+
+    def __init__(self, questions):
+        self.columns = list(dict.fromkeys(questions.values()))
+        sources = sorted(questions)
+        self.sources = np.array(sources, dtype=float)
+        self.column_index = np.array([self.columns.index(questions[s]) for s in sources])
+
+    def __call__(self, df, source):
+        answers = column_values(df, self.columns)
+        # one extra column of NaN for the households without a matching question
+        answers = np.hstack([answers, np.full((len(df), 1), np.nan)])
+        pos = np.clip(np.searchsorted(self.sources, source), 0, len(self.sources) - 1)
+        column = np.where(self.sources[pos] == source,
+                          self.column_index[pos], len(self.columns))
+        return answers[np.arange(len(df)), column]
+
+
+def choice_tiers(df, choices):
+    """Give each row the lowest tier of choices {tier: [columns]} having a selected column.
+
+    A choice is selected when its column is not empty, as in multiple_choice.
+    Rows without any selected choice get NaN.
+    """
+    tiers = sorted(choices)
+    conditions = []
+    for tier in tiers:
+        positions = index_of(df.columns).positions(choices[tier])
+        conditions.append(selected(df.iloc[:, positions]).any(axis=1))
+    return np.select(conditions, np.array(tiers, dtype=float), np.nan)
+
+
+def compile_rule(rule):
+    """Return a function f(df, source) computing the tiers of rule for all rows of df.
+
+    source holds the answers to the source question of the rule set, it is
+    only used by rules defined with 'questions'.
+    """
+    if 'choices' in rule:
+        choices = {tier: list(columns) for tier, columns in rule['choices'].items()}
+        return lambda df, source: choice_tiers(df, choices)
+
+    if 'bins' in rule:
+        bins, tiers = list(rule['bins']), list(rule['tiers'])
+        if len(tiers) != len(bins) + 1:
+            raise ValueError('a rule with %d bins needs %d tiers' % (len(bins), len(bins) + 1))
+        convert = lambda values: bin_tiers(values, bins, tiers)
+    elif 'map' in rule:
+        mapping = dict(rule['map'])
+        convert = lambda values: map_tiers(values, mapping)
+    else:
+        raise ValueError("a rule needs either 'bins' and 'tiers' or 'map'")
+
+    if 'questions' in rule:
+        lookup = ColumnLookup(rule['questions'])
+        return lambda df, source: convert(lookup(df, source))
+    if 'question' in rule:
+        question = rule['question']
+        return lambda df, source: convert(column_values(df, [question])[:, 0])
+    raise ValueError("a rule needs either 'question' or 'questions'")
+
+
+def rule_columns(rule_set):
+    """Return the columns read by rule_set, e.g. for the usecols of pd.read_csv."""
+    columns = [rule_set.get(k) for k in ('source_question', 'household_key', 'primary')]
+    for rule in rule_set['rules'].values():
+        columns.extend(_rule_questions(rule))
+    return list(dict.fromkeys(c for c in columns if c is not None))
+
+
+def _rule_questions(rule):
+    questions = [rule['question']] if 'question' in rule else []
+    questions.extend(rule.get('questions', {}).values())
+    for choices in rule.get('choices', {}).values():
+        questions.extend(choices)
+    return questions
+
+
+def applicable_rules(rule_set, columns):
+    """Return rule_set without the rules needing a question which is not in columns.
+
+    The dropped attributes, and a primary question which is not in columns,
+    are reported with a warning. Without its primary question, the tiers of a
+    household are the minimum over its rows.
+    """
+    index = index_of(columns)
+    source = rule_set.get('source_question')
+    missing_source = source is not None and source not in index
+    rules, dropped = {}, []
+    for name, rule in rule_set['rules'].items():
+        questions = _rule_questions(rule)
+        if all(q in index for q in questions) and not (missing_source and 'questions' in rule):
+            rules[name] = rule
+        else:
+            dropped.append(name)
+    applicable = dict(rule_set, rules=rules)
+    if dropped:
+        warnings.warn('no column for the questions of %s: these tiers are not computed'
+                      % ', '.join(dropped))
+    primary = rule_set.get('primary')
+    if primary is not None and primary not in index:
+        warnings.warn('no column for the primary question %s: the tiers of a household '
+                      'are the minimum over its rows' % primary)
+        applicable['primary'] = None
+    return applicable
+
+
+def compile_rules(rule_set):
+    """Return a function f(df) computing all tiers of rule_set as a DataFrame."""
+    source_question = rule_set.get('source_question')
+    compiled = {name: compile_rule(rule) for name, rule in rule_set['rules'].items()}
+
+    def evaluate(df):
+        source = None
+        if source_question is not None:
+            source = column_values(df, [source_question])[:, 0]
+        return pd.DataFrame({name: f(df, source) for name, f in compiled.items()},
+                            index=df.index)
+
+    return evaluate
+
+
+_rwanda_electricity = compile_rules(tier_rules.RWANDA_ELECTRICITY)
+
+
+def electricity_tiers(main, source_question=MAIN_SOURCE_QUESTION):
+    """Compute the E_Safety, E_daily_Availability and E_evening_Availability tiers.
+
+    Returns a DataFrame with the same index as main.
+    """
+    if source_question == MAIN_SOURCE_QUESTION:
+        return _rwanda_electricity(main)
+    rule_set = dict(tier_rules.RWANDA_ELECTRICITY, source_question=source_question)
+    return compile_rules(rule_set)(main)
+
+
+# uint8 code of a missing tier in a tier matrix, larger than any tier
+MISSING_TIER = np.iinfo(np.uint8).max
+
+
+def tier_matrix(tiers, attributes):
+    """Return the households x attributes matrix of tiers as uint8.
+
+    Missing tiers (NaN) are coded as MISSING_TIER.
+    """
+    values = tiers[list(attributes)].to_numpy(dtype=float)
+    matrix = np.full(values.shape, MISSING_TIER, dtype=np.uint8)
+    known = ~np.isnan(values)
+    matrix[known] = values[known]
+    return matrix
+
+
+def aggregate_index(tiers, attributes, name, skipna=True):
+    """Compute the MTF index of each household, the minimum tier over attributes.
+
+    Returns a DataFrame with the index in column name and, in name + '_binding',
+    the attribute giving the minimum (the first one for ties). Missing tiers are
+    ignored, or make the index NaN when skipna is False; households without any
+    tier get NaN.
+    """
+    attributes = list(attributes)
+    matrix = tier_matrix(tiers, attributes)
+    binding = matrix.argmin(axis=1)
+    index = matrix[np.arange(len(matrix)), binding].astype(float)
+
+    missing = index == MISSING_TIER
+    if not skipna:
+        missing |= (matrix == MISSING_TIER).any(axis=1)
+    index[missing] = np.nan
+    binding_name = pd.Categorical.from_codes(np.where(missing, -1, binding),
+                                             categories=attributes)
+
+    return pd.DataFrame({name: index, name + '_binding': binding_name},
+                        index=tiers.index)
+
+
+def mtf_index(tiers, all_attributes, name, partial=False, skipna=False):
+    """Compute the MTF index name, and its binding attribute, over all_attributes.
+
+    The MTF index needs the tiers of all its attributes: a ValueError is raised
+    when some of them are not columns of tiers. With partial, the index of the
+    attributes which are columns of tiers is computed instead, in name +
+    '_partial' (and name + '_partial_binding'): it is not the MTF index, only
+    an upper bound of it. A household missing one of the tiers gets no index,
+    unless skipna.
+    """
+    attributes = [a for a in all_attributes if a in tiers]
+    missing = [a for a in all_attributes if a not in tiers]
+    if missing and not partial:
+        raise ValueError('no tiers for %s: only a partial index can be computed'
+                         % ', '.join(missing))
+    return aggregate_index(tiers, attributes, name + '_partial' if missing else name, skipna)
+
+
+def electricity_index(tiers, partial=False, skipna=False):
+    """Compute E_Index and E_Index_binding from tier_rules.ELECTRICITY_ATTRIBUTES.
+
+    See mtf_index for a partial index (E_Index_partial) over the attributes
+    which are computed so far.
+    """
+    return mtf_index(tiers, tier_rules.ELECTRICITY_ATTRIBUTES, 'E_Index', partial, skipna)
+
+
+def household_segments(keys):
+    """Sort the rows by household key.
+
+    Returns the sorting order, the sorted unique keys and the position where
+    the rows of each household start in the sorted order (for reduceat).
+    """
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    return order, sorted_keys[starts], starts
+
+
+def household_tiers(section, rule_set):
+    """Compute the tiers of rule_set for a section with several rows per household.
+
+    The tiers of a household are those of its primary row when rule_set has a
+    'primary' question, and the minimum over its rows otherwise. Returns a
+    DataFrame indexed by the household key, sorted.
+    """
+    key = rule_set['household_key']
+    item_tiers = compile_rules(rule_set)(section)
+    names = list(item_tiers)
+    keys = section[key].to_numpy()
+    index = pd.Index([], name=key)
+    if len(section) == 0:
+        return pd.DataFrame(columns=names, index=index, dtype=float)
+
+    if rule_set.get('primary') is not None:
+        priority = column_values(section, [rule_set['primary']])[:, 0]
+        # rows sorted by household, then by priority (NaN last)
+        order = np.lexsort((priority, keys))
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        values = item_tiers.to_numpy(dtype=float)[order[starts]]
+        unique_keys = sorted_keys[starts]
+    else:
+        order, unique_keys, starts = household_segments(keys)
+        matrix = tier_matrix(item_tiers.iloc[order], names)
+        matrix = np.minimum.reduceat(matrix, starts, axis=0)
+        values = np.where(matrix == MISSING_TIER, np.nan, matrix.astype(float))
+
+    return pd.DataFrame(values, columns=names, index=pd.Index(unique_keys, name=key))
+
+
+def stream_household_tiers(path, rule_set, how=None, chunksize=CHUNKSIZE):
+    """Same as household_tiers, reading the section table path by chunks of rows.
+
+    Only the columns of rule_set are read, and only one chunk of rows is in
+    memory at a time. how gives other reductions of columns of the table
+    ({reduction: [columns]}, see section_stream) done in the same pass, e.g.
+    {'sum': ['I31_1', 'I31_2']}: their columns come after the tiers.
+    """
+    key, primary = rule_set['household_key'], rule_set.get('primary')
+    evaluate = compile_rules(rule_set)
+    names = list(rule_set['rules'])
+    how = {reduction: list(columns) for reduction, columns in (how or {}).items()}
+    kept = list(dict.fromkeys(c for columns in how.values() for c in columns))
+
+    def tiers_of_rows(chunk):
+        tiers = evaluate(chunk)
+        tiers[key] = chunk[key].to_numpy()
+        if primary is not None:
+            tiers[primary] = column_values(chunk, [primary])[:, 0]
+        for column in kept:
+            tiers[column] = chunk[column].to_numpy()
+        return tiers
+
+    reduction = 'first' if primary is not None else 'min'
+    how[reduction] = names + how.get(reduction, [])
+    columns = list(dict.fromkeys(rule_columns(rule_set) + kept))
+    tiers = aggregate_section(path, how, key, primary, transform=tiers_of_rows,
+                              columns=columns, chunksize=chunksize)
+    return tiers[names].astype(float).join(tiers[[c for c in kept if c not in names]])
+
+
+def cooking_tiers(section_I, rule_set=tier_rules.RWANDA_COOKING):
+    """Compute the cooking tiers per household from the stoves of section I.
+
+    Only the columns given by rule_columns(rule_set) are used.
+    """
+    return household_tiers(section_I, rule_set)
+
+
+def cooking_index(tiers, partial=False, skipna=False):
+    """Compute C_Index and C_Index_binding from tier_rules.COOKING_ATTRIBUTES.
+
+    See mtf_index for a partial index (C_Index_partial).
+    """
+    return mtf_index(tiers, tier_rules.COOKING_ATTRIBUTES, 'C_Index', partial, skipna)
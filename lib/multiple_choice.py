@@ -0,0 +1,123 @@
+"""Multiple choice questions packed into bit masks.
+
+A multiple choice question such as C40 (most serious problems with the grid)
+is stored in the survey as one sparse column per choice, C40_1_... to
+C40_11_..., holding the code of the choice when it is selected. A
+MultipleChoice reads these columns once and packs the answers of each household
+into one integer, bit k being set when the k-th choice is selected. Counts per
+choice (overall or per group), the number of selected choices and any/all/only
+selections are then computed on this single array.
+
+    C40 = MultipleChoice(main, 'C40')
+    C40.counts()                  # households having selected each choice
+    C40.any_of([4, 5, 9])         # households with a problem related to bills
+    C40.counts_by(main['habitat'])
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+# number of set bits of each byte
+_POPCOUNT_TABLE = np.array([bin(b).count('1') for b in range(256)], dtype=np.uint8)
+
+
+def choice_columns(columns, question):
+    """Return {choice: column} for the columns named question_<choice>[_label]."""
+    pattern = re.compile(r'^%s_(\d+)(_|$)' % re.escape(question))
+    found = {}
+    for column in columns:
+        match = pattern.match(str(column))
+        if match:
+            found[int(match.group(1))] = column
+    return dict(sorted(found.items()))
+
+
+def mask_dtype(n_choices):
+    """Smallest unsigned integer type holding n_choices bits."""
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if n_choices <= np.iinfo(dtype).bits:
+            return dtype
+    raise ValueError('at most 64 choices can be packed, got %d' % n_choices)
+
+
+def selected(values):
+    """A choice is selected when its column is not empty, whatever its value.
+
+    As counted by the chapters with .dropna(): a 0, or the text of the choice,
+    are selections too.
+    """
+    return np.asarray(pd.notna(values), dtype=bool)
+
+
+def popcount(masks):
+    """Number of set bits of each mask."""
+    masks = np.ascontiguousarray(masks)
+    as_bytes = masks.view(np.uint8).reshape(len(masks), masks.dtype.itemsize)
+    return _POPCOUNT_TABLE[as_bytes].sum(axis=1)
+
+
+class MultipleChoice:
+    """Answers of a multiple choice question, as one bit mask per row of df."""
+
+    def __init__(self, df, question, columns=None):
+        """Pack the choices of question, found by name or given as {choice: column}."""
+        self.question = question
+        self.columns = columns if columns is not None else choice_columns(df.columns, question)
+        if not self.columns:
+            raise KeyError('no column found for the choices of %s' % question)
+        self.choices = list(self.columns)
+        self.dtype = mask_dtype(len(self.choices))
+        self.index = df.index
+
+        masks = np.zeros(len(df), dtype=self.dtype)
+        for bit, column in enumerate(self.columns.values()):
+            masks[selected(df[column])] |= self.dtype(1) << self.dtype(bit)
+        self.masks = masks
+
+    def __len__(self):
+        return len(self.masks)
+
+    def mask_of(self, choices):
+        """The mask having the bits of choices set."""
+        mask = self.dtype(0)
+        for choice in choices:
+            mask |= self.dtype(1) << self.dtype(self.choices.index(choice))
+        return mask
+
+    def n_selected(self):
+        """Number of choices selected in each row."""
+        return popcount(self.masks)
+
+    def any_of(self, choices):
+        """Rows where at least one of choices is selected."""
+        return (self.masks & self.mask_of(choices)) != 0
+
+    def all_of(self, choices):
+        """Rows where all choices are selected."""
+        mask = self.mask_of(choices)
+        return (self.masks & mask) == mask
+
+    def only(self, choices):
+        """Rows where some of choices, and no other choice, are selected."""
+        mask = self.mask_of(choices)
+        return (self.masks != 0) & ((self.masks & ~mask) == 0)
+
+    def bits(self, select=None):
+        """Boolean matrix rows x choices, for the rows where select is True."""
+        if isinstance(select, pd.Series):
+            # missing answers (<NA>) of nullable columns are not selected
+            select = select.fillna(False)
+        masks = self.masks if select is None else self.masks[np.asarray(select, dtype=bool)]
+        as_bytes = np.ascontiguousarray(masks).view(np.uint8).reshape(len(masks), -1)
+        bits = np.unpackbits(as_bytes, axis=1, bitorder='little')
+        return bits[:, :len(self.choices)].astype(bool)
+
+    def counts(self, select=None):
+        """Number of rows (where select is True) having selected each choice."""
+        return pd.Series(self.bits(select).sum(axis=0), index=self.choices, name=self.question)
+
+    def counts_by(self, groups):
+        """Number of rows having selected each choice, per value of groups."""
+        bits = pd.DataFrame(self.bits(), columns=self.choices, index=self.index)
+        return bits.groupby(np.asarray(groups)).sum()
@@ -0,0 +1,310 @@
+"""Cache of the household tables built from the ODK results.
+
+The HIT chapters (kenya, fondesurco, te_creemos, general, mtf, dummy) build
+their household table with
+
+    data = mfi.read_survey(mfi.odk_data_name)
+    mfi.HH = odk.households(data)
+
+odk.households processes the submissions one by one, which takes most of the
+time of these chapters for institutions with thousands of submissions.
+odk_interface belongs to the HIT sources, outside this book, so that loop is
+not vectorized here: instead each submission goes through it once. During
+a field campaign the ODK results files only gain rows: read_survey_incremental
+keeps the parsed submissions and their households in a store of the data
+cache (see data_cache.py), with the number of bytes of each file already read.
+The next builds parse only the rows appended since, build the households of
+these new submissions only, and append them to the store. The store is made
+of Parquet files, which build_book.py --shared-data publishes in shared
+memory like the other entries of the cache.
+
+    data, mfi.HH = read_survey_incremental(mfi, odk, mfi.odk_data_name,
+                                           modules=[hedera])
+
+Only the rows appended to the last file (the current wave) are parsed on
+their own, so that the tables stay those of a full read; the first time, the
+result is checked against a full read. The files are read again from the
+start when another file changed, when the part already read changed (e.g. a
+submission was edited or deleted), or when odk_interface, modules or inputs
+change.
+
+Surveys collected in several waves (e.g. FONDESURCO_1 and FONDESURCO_2) are
+split over several files: read_surveys parses them concurrently, one process
+per file, and concatenates them once, with the union of their columns.
+"""
+import hashlib
+import json
+import os
+import pickle
+import sys
+import tempfile
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from data_cache import (CACHE_DIR, _read_json, _write_atomic, _write_json, file_fingerprint,
+                        module_paths, read_entry)
+
+
+def _paths(sources):
+    if isinstance(sources, (str, os.PathLike)):
+        return [os.path.abspath(sources)]
+    return [os.path.abspath(s) for s in sources]
+
+
+def _entry_paths(paths, options):
+    key = json.dumps([paths, options], sort_keys=True, default=str)
+    base = os.path.join(CACHE_DIR, 'households_%s' % hashlib.sha1(key.encode()).hexdigest())
+    return base + '.parquet', base + '.json'
+
+
+def _fingerprints(paths, previous):
+    previous = previous or {}
+    return {p: file_fingerprint(p, previous.get(p)) for p in paths}
+
+
+def _same_content(fingerprints, previous):
+    return (previous is not None and set(fingerprints) == set(previous)
+            and all(f['sha256'] == previous[p]['sha256'] for p, f in fingerprints.items()))
+
+
+def _store_paths(paths, institution, options):
+    data_file, meta_file = _entry_paths(['survey', institution] + paths, options)
+    base = data_file[:-len('.parquet')]
+    return {'parquet': [base + '_data.parquet', base + '_households.parquet'],
+            'pickle': [base + '.pkl']}, meta_file
+
+
+def _read_store(files):
+    if len(files) == 2:
+        # from shared memory during a parallel build (see data_cache.read_entry)
+        return read_entry(files[0]), read_entry(files[1])
+    return pd.read_pickle(files[0])
+
+
+def _write_store(store, data, households):
+    """Write the tables in the Parquet files of store, or else its pickle file.
+
+    Returns the format used.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    try:
+        for path, table in zip(store['parquet'], (data, households)):
+            _write_atomic(path, table.to_parquet)
+        form = 'parquet'
+    except Exception as e:
+        # e.g. columns mixing numbers and text cannot be stored in Parquet
+        warnings.warn('the ODK results are stored as pickle, they cannot be shared '
+                      'between the kernels: %s' % e)
+        _write_atomic(store['pickle'][0], lambda path: pd.to_pickle((data, households), path))
+        form = 'pickle'
+    for other, files in store.items():
+        for path in files if other != form else ():
+            if os.path.exists(path):
+                os.remove(path)
+    return form
+
+
+def _read_prefix(path, previous, block_size=1 << 20):
+    """sha256 of the part of path read last time, None when this part changed.
+
+    The hash is returned unfinished, to be updated with the rows read next.
+    """
+    h = hashlib.sha256()
+    size, last = previous['offset'], b''
+    with open(path, 'rb') as f:
+        while size > 0:
+            block = f.read(min(block_size, size))
+            if not block:
+                return None
+            h.update(block)
+            size -= len(block)
+            last = block
+        following = f.read(1)
+    if h.hexdigest() != previous['sha256']:
+        return None
+    if last and not last.endswith(b'\n') and following not in (b'', b'\r', b'\n'):
+        # the last row, read at the end of the file, was continued since
+        return None
+    return h
+
+
+def _complete_rows(tail, at_end=True):
+    """Length of the complete rows at the start of tail (quoted newlines excluded).
+
+    When tail ends the file (at_end), a last row without newline is complete,
+    unless it is inside quotes.
+    """
+    if at_end and tail and not tail.endswith(b'\n') and tail.count(b'"') % 2 == 0:
+        return len(tail)
+    end = tail.rfind(b'\n')
+    while end >= 0 and tail.count(b'"', 0, end) % 2:
+        end = tail.rfind(b'\n', 0, end)
+    return end + 1
+
+
+def _header(path):
+    with open(path, 'rb') as f:
+        return f.readline()
+
+
+def _concat(frames):
+    # columns in the order of their first appearance, missing ones are NaN
+    ignore_index = all(isinstance(f.index, pd.RangeIndex) for f in frames)
+    return pd.concat(frames, ignore_index=ignore_index, sort=False)
+
+
+def _renumber(new, start):
+    # rows of the new submissions numbered after the start stored ones; the
+    # same rule for data and households keeps them aligned
+    if pd.api.types.is_integer_dtype(new.index):
+        return new.set_axis(new.index + start, axis=0)
+    return new
+
+
+def _read_survey(read_survey, path, options):
+    return read_survey(path, **options)
+
+
+def read_surveys(mfi, paths, workers=None, **options):
+    """Concatenation of mfi.read_survey(path, **options) of each of paths.
+
+    The files are parsed in parallel, one process per file, when mfi can be
+    sent to the worker processes, and else one after the other. Columns which
+    only some files have are missing (NaN) for the rows of the other files.
+    """
+    paths = list(paths)
+    for path in paths:
+        # the worker processes are not seen by the audit hook of build_book
+        sys.audit('data_cache.read', os.path.abspath(path))
+    if len(paths) == 1:
+        return mfi.read_survey(paths[0], **options)
+    try:
+        pickle.dumps(mfi.read_survey)
+    except Exception as e:
+        warnings.warn('the survey files are read one after the other: %s' % e)
+        frames = [mfi.read_survey(path, **options) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers or len(paths)) as pool:
+            frames = list(pool.map(_read_survey, [mfi.read_survey] * len(paths), paths,
+                                   [options] * len(paths)))
+    return _concat(frames)
+
+
+def _same_tables(table, other):
+    try:
+        pd.testing.assert_frame_equal(table, other, check_dtype=False, check_index_type=False,
+                                      check_column_type=False)
+    except AssertionError:
+        return False
+    return True
+
+
+def _read_all(mfi, odk, paths, options):
+    """(data, households, fingerprints of paths) of a full read, fingerprints None
+    when a file changed during the read."""
+    before = {p: file_fingerprint(p) for p in paths}
+    data = read_surveys(mfi, paths, **options)
+    households = odk.households(data)
+    if any(_changed(p, before[p]) for p in paths):
+        return data, households, None
+    return data, households, {p: dict(f, offset=f['size']) for p, f in before.items()}
+
+
+def _changed(path, previous):
+    # other size or modification time than when the file was last read
+    stat = os.stat(path)
+    return stat.st_size != previous.get('size') or stat.st_mtime != previous.get('mtime')
+
+
+def read_survey_incremental(mfi, odk, sources, modules=(), inputs=(), institution=None,
+                            **options):
+    """Return (data, households) of the ODK results files sources.
+
+    data is read_surveys(mfi, sources, **options) and households
+    odk.households(data). When rows were only appended to the last of the
+    files since the last call, only these rows are parsed, by giving
+    mfi.read_survey a copy of the header and of these rows, and only their
+    households are built. The first time a store is extended this way, the
+    result is compared with a full read: when they differ (the households of
+    the new submissions depend on the other submissions, e.g. through the
+    joins of read_survey), the files are always read in full for this store.
+    They are also read in full when another file changed, and when odk,
+    modules or the other files read by read_survey, inputs (e.g.
+    mfi.gpsFile), change. Each institution (by default mfi.institution_id)
+    has its own store, even when it reads the same files.
+    """
+    paths = _paths(sources)
+    for path in paths + _paths(inputs):
+        # lets build_book know that path is read, even when it is served from the store
+        sys.audit('data_cache.read', path)
+    if institution is None:
+        institution = getattr(mfi, 'institution_id', None)
+    store, meta_file = _store_paths(paths, institution, options)
+    meta = _read_json(meta_file)
+    code = _fingerprints(module_paths([odk] + list(modules)) + _paths(inputs),
+                        meta and meta['code'])
+    reusable = (meta is not None and _same_content(code, meta['code'])
+                and all(os.path.exists(f) for f in store[meta.get('store', 'pickle')])
+                and set(meta['files']) == set(paths))
+
+    # the rows appended to the files read last time, their new fingerprints
+    files, tails = {}, {}
+    for path in paths if reusable else ():
+        previous = meta['files'][path]
+        if not _changed(path, previous):
+            files[path] = previous
+            continue
+        h = _read_prefix(path, previous)
+        if h is None:
+            reusable = False
+            break
+        stat = os.stat(path)
+        with open(path, 'rb') as f:
+            f.seek(previous['offset'])
+            tail = f.read(stat.st_size - previous['offset'])
+        length = _complete_rows(tail)
+        h.update(tail[:length])
+        files[path] = {'offset': previous['offset'] + length, 'sha256': h.hexdigest(),
+                       'size': stat.st_size, 'mtime': stat.st_mtime}
+        if tail[:length].strip(b'\r\n'):
+            tails[path] = _header(path) + tail[:length].lstrip(b'\r\n')
+
+    verified = meta and meta.get('verified')
+    if reusable and not tails:
+        data, households = _read_store(store[meta.get('store', 'pickle')])
+        if files != meta['files']:
+            # same contents, new mtimes: avoid hashing the files next time
+            _write_atomic(meta_file, _write_json(dict(meta, files=files)))
+        return data, households
+
+    if reusable and list(tails) == paths[-1:] and verified is not False:
+        # submissions appended to the last file, as in a full read
+        data, households = _read_store(store[meta.get('store', 'pickle')])
+        with tempfile.TemporaryDirectory() as tmp:
+            tail_file = os.path.join(tmp, os.path.basename(paths[-1]))
+            with open(tail_file, 'wb') as f:
+                f.write(tails[paths[-1]])
+            new_data = read_surveys(mfi, [tail_file], **options)
+        new_households = odk.households(new_data)
+        start = len(data)
+        data = pd.concat([data, _renumber(new_data, start)], sort=False)
+        households = pd.concat([households, _renumber(new_households, start)], sort=False)
+        if not verified:
+            full_data, full_households, full_files = _read_all(mfi, odk, paths, options)
+            verified = _same_tables(data, full_data) and _same_tables(households, full_households)
+            if not verified:
+                warnings.warn('the households of the new submissions of %s depend on the other '
+                              'submissions: these files are always read in full'
+                              % ', '.join(paths))
+                data, households, files = full_data, full_households, full_files
+    else:
+        data, households, files = _read_all(mfi, odk, paths, options)
+        verified = verified if reusable else None
+
+    if files is not None:
+        form = _write_store(store, data, households)
+        _write_atomic(meta_file, _write_json({'code': code, 'files': files, 'store': form,
+                                              'verified': verified}))
+    return data, households
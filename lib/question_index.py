@@ -0,0 +1,110 @@
+"""Index of the questions of a dataset by their short code.
+
+The columns of the survey are named after the code of the question followed by
+its label, e.g. 'R8_How satisfied are you with the service from the source on
+C182' or 'C40_3_Unpredictable interruptions' for the third choice of C40. A
+QuestionIndex is built once from the header of a dataset (and optionally the
+labels of the codebook) and gives, in constant time, the position, the column
+and the label of a question from its code:
+
+    index = QuestionIndex(main.columns)
+    index.column('R8')        # 'R8_How satisfied are you with ...'
+    index.position('C173b')   # position of the column in main
+    index.choices('C40')      # codes of the choices of C40: ['C40_1', ...]
+    values = main.to_numpy()
+    values[:, index.positions(['C26b', 'C27b'])]
+
+Columns which are not named after a code (Province, HHID, habitat...) are
+indexed by their full name. A full column name can be used wherever a code is
+expected.
+"""
+import re
+from functools import lru_cache
+
+# a question code (letters, digits, optional lowercase letter), optionally
+# followed by the number of a choice, e.g. B5, C173b, I31_3
+_CODE = re.compile(r'^([A-Za-z]+\d+[a-z]?)(?:_(\d+))?(?=_|$)')
+
+
+def question_code(column):
+    """Return (code, question code) of a column name, or (None, None).
+
+    The code of 'C40_3_Unpredictable interruptions' is 'C40_3', its question
+    code 'C40'.
+    """
+    match = _CODE.match(str(column))
+    if match is None:
+        return None, None
+    question, choice = match.groups()
+    if choice is None:
+        return question, question
+    return '%s_%s' % (question, choice), question
+
+
+class QuestionIndex:
+    """Position, column and label of the questions of a header, by code."""
+
+    def __init__(self, columns, labels=None):
+        """Index columns; labels {code: label} are usually read from the codebook."""
+        self.columns = list(columns)
+        self.labels = dict(labels or {})
+        self._positions = {}
+        self._choices = {}
+        for position, column in enumerate(self.columns):
+            self._positions.setdefault(column, position)
+            code, question = question_code(column)
+            if code is None:
+                continue
+            # the first column of a code wins, e.g. C2 over C2_1 if both exist
+            self._positions.setdefault(code, position)
+            if code != question:
+                self._choices.setdefault(question, []).append(code)
+
+    @classmethod
+    def from_codebook(cls, columns, codebook_path):
+        """Index columns, with the labels of the compiled codebook (see codebook.py)."""
+        from codebook import load_codebook
+        return cls(columns, load_codebook(codebook_path).labels())
+
+    def __contains__(self, code):
+        return code in self._positions
+
+    def __len__(self):
+        return len(self.columns)
+
+    def position(self, code):
+        """Position of the column of code (or of a full column name)."""
+        try:
+            return self._positions[code]
+        except KeyError:
+            raise KeyError('no column found for %s' % code) from None
+
+    def positions(self, codes):
+        """List of the positions of the columns of codes."""
+        return [self.position(code) for code in codes]
+
+    def column(self, code):
+        """Full name of the column of code."""
+        return self.columns[self.position(code)]
+
+    def label(self, code):
+        """Label of code, from the codebook or else from the column name."""
+        if code in self.labels:
+            return self.labels[code]
+        column = str(self.column(code))
+        code = question_code(column)[0]
+        return column[len(code) + 1:] if code and len(column) > len(code) else column
+
+    def choices(self, question):
+        """Codes of the choices of a multiple choice question, in the order of the columns."""
+        return list(self._choices.get(question, []))
+
+
+@lru_cache(maxsize=32)
+def _index_of(columns):
+    return QuestionIndex(columns)
+
+
+def index_of(columns):
+    """QuestionIndex of columns, built once per distinct header."""
+    return _index_of(tuple(columns))
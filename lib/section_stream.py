@@ -0,0 +1,118 @@
+"""Per-household aggregation of the section tables, read by chunks.
+
+A section table has one row per stove, member or appliance; the chapters only
+use it reduced per household (HHID). aggregate_section reads the table by
+chunks of rows, with only the columns needed, and folds each chunk into one
+accumulator per household, so the memory used depends on the number of
+households and not on the number of rows of the file:
+
+    sums = aggregate_section('csv/I.csv', {'sum': ['I31_1', 'I31_2']})
+    stoves = aggregate_section('csv/I.csv', {'any': ['I31_1'], 'first': ['I4']},
+                               priority='I2')
+
+The reductions are:
+
+- 'sum': sum of the values (missing values count as 0, as in groupby().sum());
+- 'any': whether one of the rows has a selected answer (not empty, as in
+  multiple_choice.selected);
+- 'min' and 'max': ignoring missing values;
+- 'first': values of the row with the lowest priority (missing priorities last,
+  ties go to the first row of the file).
+"""
+import pandas as pd
+
+from households import SECTION_KEY
+from multiple_choice import selected
+
+# rows read at a time
+CHUNKSIZE = 100000
+
+REDUCTIONS = ('sum', 'any', 'min', 'max', 'first')
+
+
+def read_chunks(path, columns=None, chunksize=CHUNKSIZE, **kwargs):
+    """Iterate over the chunks of rows of a CSV file, with only columns."""
+    return pd.read_csv(path, usecols=columns, chunksize=chunksize, **kwargs)
+
+
+class HouseholdAccumulator:
+    """Reduction per household of rows given chunk by chunk."""
+
+    def __init__(self, how, key=SECTION_KEY, priority=None):
+        """how is {reduction: [columns]}; 'first' needs the priority column."""
+        unknown = set(how) - set(REDUCTIONS)
+        if unknown:
+            raise ValueError('unknown reductions: %s' % ', '.join(sorted(unknown)))
+        if how.get('first') and priority is None:
+            raise ValueError("the 'first' reduction needs a priority column")
+        self.how = {reduction: list(columns) for reduction, columns in how.items()}
+        self.key = key
+        self.priority = priority
+        self.parts = {}
+
+    def columns(self):
+        """Columns read from the rows."""
+        columns = [self.key] + [c for cs in self.how.values() for c in cs]
+        if self.how.get('first'):
+            columns.append(self.priority)
+        return list(dict.fromkeys(columns))
+
+    def _reduce(self, reduction, chunk):
+        columns = self.how[reduction]
+        if reduction == 'first':
+            ordered = chunk.sort_values(self.priority, kind='stable', na_position='last')
+            kept = list(dict.fromkeys(columns + [self.priority]))
+            return ordered.drop_duplicates(self.key).set_index(self.key)[kept]
+        if reduction == 'any':
+            answered = pd.DataFrame(selected(chunk[columns]), columns=columns, index=chunk.index)
+            return answered.groupby(chunk[self.key]).any()
+        return getattr(chunk.groupby(self.key)[columns], reduction)()
+
+    def _fold(self, reduction, previous, part):
+        if reduction == 'sum':
+            return previous.add(part, fill_value=0)
+        if reduction == 'any':
+            return previous.reindex(previous.index.union(part.index), fill_value=False) \
+                | part.reindex(previous.index.union(part.index), fill_value=False)
+        if reduction in ('min', 'max'):
+            both = pd.concat([previous, part])
+            return getattr(both.groupby(level=0), reduction)()
+        # first: rows of the previous chunks come first, and win the ties
+        return self._reduce('first', pd.concat([previous, part]).reset_index())
+
+    def add(self, chunk):
+        """Fold a chunk of rows into the accumulators."""
+        for reduction in self.how:
+            part = self._reduce(reduction, chunk)
+            previous = self.parts.get(reduction)
+            self.parts[reduction] = part if previous is None else self._fold(reduction, previous, part)
+
+    def result(self):
+        """DataFrame of the reductions, indexed by household (sorted)."""
+        frames = []
+        for reduction, columns in self.how.items():
+            part = self.parts.get(reduction)
+            if part is None:
+                part = pd.DataFrame(columns=columns, index=pd.Index([], name=self.key))
+            frames.append(part[columns])
+        result = pd.concat(frames, axis=1).sort_index()
+        result.index.name = self.key
+        return result
+
+
+def aggregate_section(path, how, key=SECTION_KEY, priority=None, transform=None,
+                      columns=None, chunksize=CHUNKSIZE):
+    """Reduce the rows of the CSV file path per household, reading it by chunks.
+
+    transform, if given, is applied to each chunk before the reduction (e.g. to
+    compute tiers per row); it must keep the key column. columns are the
+    columns read from the file, by default those used by the reductions.
+    """
+    accumulator = HouseholdAccumulator(how, key, priority)
+    if columns is None:
+        columns = accumulator.columns()
+    for chunk in read_chunks(path, columns, chunksize):
+        if transform is not None:
+            chunk = transform(chunk)
+        accumulator.add(chunk)
+    return accumulator.result()
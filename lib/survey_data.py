@@ -0,0 +1,183 @@
+"""Loading of the survey datasets used by the chapters.
+
+    main = read_main('../Rwanda/raw_data/main.xlsx')
+    main = read_main('../Rwanda/raw_data/main.xlsx', questions=['C1*', 'R8', 'habitat'])
+
+read_main reads the main dataset through the columnar cache (data_cache) and
+adds the derived columns of derived_columns.DERIVED_COLUMNS, such as habitat.
+The columns are then given compact dtypes (compact_dtypes.py): coded answers
+become small nullable integers and administrative areas categoricals. The
+derived columns and dtypes are part of the cache entry, which is invalidated
+when their definition changes (the source of derived_columns.py or
+compact_dtypes.py): changing a rule computes them again.
+
+With questions, only the matching columns are read from the cache. A
+question code such as 'R8' or 'I31_3' matches the column named after it and
+the columns starting with the code followed by '_' (its label, or the choices
+of a multiple choice question); a pattern with '*', such as 'C1*' or 'C40_*',
+is matched against the whole column names.
+
+A SurveyDataset gives access to main and to the tables of the sections of the
+questionnaire (csv/A.csv to csv/T.csv), each read on first access only:
+
+    survey = SurveyDataset('../Rwanda/raw_data', main_questions=['habitat'])
+    survey.main
+    survey.I                                  # section I, all its columns
+    survey.section('I', ['I31'])              # section I, HHID and I31_*
+    survey.columns('I')                       # names of the columns of section I
+    survey.attach('I', ['habitat'], ['I31'])  # with the habitat of each household
+    survey.aggregate('I', {'sum': ['I31_1']}) # reduced per household, read by chunks
+"""
+import fnmatch
+import os
+import sys
+
+import pandas as pd
+
+import compact_dtypes as _compact_dtypes
+import derived_columns as _derived_columns
+from compact_dtypes import compact_dtypes
+from data_cache import cached_read
+from derived_columns import DERIVED_COLUMNS, add_derived_columns
+from households import MAIN_KEY, SECTION_KEY, HouseholdIndex
+from section_stream import aggregate_section
+
+# sections of the questionnaire, each exported as csv/<section>.csv
+SECTIONS = list('ABCDEFGHIJKLMNOPQRST')
+
+# modules computing the cached tables, besides this one
+READER_MODULES = [_compact_dtypes, _derived_columns]
+
+
+def read_excel_derived(path, derived=None, compact=False, **kwargs):
+    """pd.read_excel(path, **kwargs) with the derived columns added and, if compact, compact dtypes."""
+    df = add_derived_columns(pd.read_excel(path, **kwargs), derived or {})
+    return compact_dtypes(df) if compact else df
+
+
+def read_csv_compact(path, compact=False, **kwargs):
+    """pd.read_csv(path, **kwargs) with, if compact, compact dtypes."""
+    df = pd.read_csv(path, **kwargs)
+    return compact_dtypes(df) if compact else df
+
+
+def matches(column, question):
+    """Whether column is the column, or one of the columns, of question."""
+    column = str(column)
+    if '*' in question:
+        return fnmatch.fnmatchcase(column, question)
+    return column == question or column.startswith(question + '_')
+
+
+def select_columns(columns, questions):
+    """Return the columns matching one of questions, in the order of columns.
+
+    Raises KeyError when a question matches no column.
+    """
+    questions = list(questions)
+    for question in questions:
+        if not any(matches(c, question) for c in columns):
+            raise KeyError('no column found for %s' % question)
+    return [c for c in columns if any(matches(c, q) for q in questions)]
+
+
+def read_main(path, questions=None, derived=DERIVED_COLUMNS, compact=True, **kwargs):
+    """Read the main dataset with its derived columns, from the cache when possible.
+
+    When questions (codes or patterns) is given, only their columns are read.
+    With compact=False, the dtypes given by pd.read_excel are kept.
+    """
+    columns = None
+    if questions is not None:
+        columns = lambda available: select_columns(available, questions)
+    return cached_read(path, read_excel_derived, columns=columns,
+                       modules=READER_MODULES + [sys.modules[__name__]], derived=derived,
+                       compact=compact, **kwargs)
+
+
+def _projection(questions):
+    if questions is None:
+        return None
+    return lambda available: select_columns(available, questions)
+
+
+def read_section(path, questions=None, compact=True, **kwargs):
+    """Read the table of a section, from the cache when possible.
+
+    When questions (codes or patterns) is given, only their columns and the
+    household identifier are read.
+    """
+    if questions is not None:
+        questions = [SECTION_KEY] + [q for q in questions if q != SECTION_KEY]
+    return cached_read(path, read_csv_compact, columns=_projection(questions),
+                       modules=READER_MODULES + [sys.modules[__name__]], compact=compact,
+                       **kwargs)
+
+
+class SurveyDataset:
+    """The main dataset and the section tables of a survey, read when first used."""
+
+    def __init__(self, root, main_questions=None, compact=True):
+        """root is the raw_data directory, holding main.xlsx and csv/.
+
+        main_questions restricts the columns read from main (the household
+        identifier is always read).
+        """
+        self.root = root
+        self.compact = compact
+        self.main_questions = main_questions
+        if main_questions is not None and MAIN_KEY not in main_questions:
+            self.main_questions = [MAIN_KEY] + list(main_questions)
+        self._main = None
+        self._households = None
+        self._sections = {}
+
+    @property
+    def main(self):
+        """The main dataset, one row per household."""
+        if self._main is None:
+            self._main = read_main(os.path.join(self.root, 'main.xlsx'), self.main_questions,
+                                   compact=self.compact)
+        return self._main
+
+    @property
+    def households(self):
+        """HouseholdIndex of main, shared by all the sections."""
+        if self._households is None:
+            self._households = HouseholdIndex(self.main)
+        return self._households
+
+    def section_path(self, section):
+        return os.path.join(self.root, 'csv', '%s.csv' % section)
+
+    def columns(self, section):
+        """Columns of the table of section, read from its header only."""
+        return list(pd.read_csv(self.section_path(section), nrows=0).columns)
+
+    def section(self, section, questions=None):
+        """Table of section ('A' to 'T'), restricted to questions if given."""
+        key = (section, None if questions is None else tuple(questions))
+        if key not in self._sections:
+            if section not in SECTIONS:
+                raise KeyError('unknown section %s' % section)
+            self._sections[key] = read_section(self.section_path(section), questions,
+                                               compact=self.compact)
+        return self._sections[key]
+
+    def attach(self, section, columns, questions=None):
+        """Table of section with the columns of main of the household of each row."""
+        return self.households.attach(self.section(section, questions), columns)
+
+    def aggregate(self, section, how, **kwargs):
+        """Table of section reduced per household by section_stream.aggregate_section.
+
+        The table is read by chunks of rows and is not kept in memory.
+        """
+        if section not in SECTIONS:
+            raise KeyError('unknown section %s' % section)
+        return aggregate_section(self.section_path(section), how, **kwargs)
+
+    def __getattr__(self, name):
+        if name in SECTIONS:
+            return self.section(name)
+        raise AttributeError(name)
@@ -0,0 +1,131 @@
+"""MTF tier rules, written as data.
+
+Each rule set maps the name of a tier column to a rule. A rule says where the
+answer of a household is found and how it is converted into a tier:
+
+- 'question': the column holding the answer, or
+- 'questions': {answer to the source question: column}, when the question
+  depends on the main source of the household (the source question is given
+  by the 'source_question' entry of the rule set);
+- 'bins' and 'tiers': tier tiers[k] is given when bins[k-1] <= answer < bins[k]
+  (len(tiers) == len(bins) + 1), or
+- 'map': {coded answer: tier}, any other answer gives no tier, or
+- 'choices': {tier: [columns]} for multiple choice questions, where a choice
+  is selected when its column is not empty (multiple_choice.selected): the
+  lowest tier having a selected choice is given (this replaces
+  'question'/'questions').
+
+A rule set of a section with one row per item (e.g. one row per stove in
+section I) also gives the 'household_key' column; the tiers of the items of a
+household are reduced to their minimum, or taken from its primary item when a
+'primary' question is given (the item with the lowest answer is the primary one).
+
+Columns can be given by their full name or by the code of their question
+(e.g. 'C26b', 'I31_3').
+
+Rule sets are compiled into vectorized evaluators by mtf_tiers.compile_rules,
+so adding an attribute or a country only means adding an entry here.
+"""
+
+# Answers to C182 (main source of electricity)
+NATIONAL_GRID = 1
+MINI_GRID = 2
+GENERATOR = 3
+SOLAR_HOME_SYSTEM = 4
+SOLAR_LANTERN = 5
+BATTERY = 6
+PICO_HYDRO = 7
+
+# Hours of availability (Typical Months)
+DAILY_AVAILABILITY_BINS = [4, 8, 16, 23]
+DAILY_AVAILABILITY_TIERS = [0, 2, 3, 4, 5]
+EVENING_AVAILABILITY_BINS = [1, 2, 3, 4]
+EVENING_AVAILABILITY_TIERS = [0, 1, 2, 3, 5]
+
+# Injuries in the last 12 months: 1 = Yes (serious or fatal injuries), 2 = No
+SAFETY_TIERS = {1: 3, 2: 5}
+
+RWANDA_ELECTRICITY = {
+    'source_question': 'C182_which is the source that you use most of the time',
+    'rules': {
+        'E_Safety': {
+            'questions': {
+                NATIONAL_GRID: 'C41_household member died or damaged because of electricity',
+                MINI_GRID: 'C83_household members die or injured because of the grid electricity',
+                GENERATOR: 'C112_household members died or injured because of the generator',
+                SOLAR_HOME_SYSTEM: 'C175_household members died or  injured because of the DEVICE',
+                SOLAR_LANTERN: 'C175_household members died or  injured because of the DEVICE',
+                BATTERY: 'C130_household members died  injured because of the rechargeable batteries',
+                PICO_HYDRO: 'C142_household members died injured because of the pico-hydro system',
+            },
+            'map': SAFETY_TIERS,
+        },
+        'E_daily_Availability': {
+            'questions': {
+                NATIONAL_GRID: 'C26b_hours of electricity availability each day and night (Typical Months)',
+                MINI_GRID: 'C68b_hours of electricity availability each day and night (Typical Months)',
+                GENERATOR: 'C107b_hours could you use this generator each day and night  (Typical Months)',
+                SOLAR_HOME_SYSTEM: 'C172b_hours you receive service from this DEVICE each day and night (Typical Months)',
+                SOLAR_LANTERN: 'C172b_hours you receive service from this DEVICE each day and night (Typical Months)',
+                BATTERY: 'C127_hours  you could use rechargeable batteries for electricity supply each day',
+                PICO_HYDRO: 'C137b_hours you could use this pico-hydro system each day and night (Typical Months)',
+            },
+            'bins': DAILY_AVAILABILITY_BINS,
+            'tiers': DAILY_AVAILABILITY_TIERS,
+        },
+        # there is no evening question for rechargeable batteries
+        'E_evening_Availability': {
+            'questions': {
+                NATIONAL_GRID: 'C27b_hours electricity is available each evening (Typical Month)',
+                MINI_GRID: 'C69b_hours of electricity availability each evening (Typical Months)',
+                GENERATOR: 'C108b_hours could you use this generator each evening (Typical Months)',
+                SOLAR_HOME_SYSTEM: 'C173b_C173a_hours is service available from this DEVICE each evening (Typical Months)',
+                SOLAR_LANTERN: 'C173b_C173a_hours is service available from this DEVICE each evening (Typical Months)',
+                PICO_HYDRO: 'C138b_hours you could use this pico-hydro system each evening (Typical Months)',
+            },
+            'bins': EVENING_AVAILABILITY_BINS,
+            'tiers': EVENING_AVAILABILITY_TIERS,
+        },
+    },
+}
+
+# Attributes of access to electricity, the MTF index is their minimum
+ELECTRICITY_ATTRIBUTES = [
+    'E_Capacity',
+    'E_daily_Availability',
+    'E_evening_Availability',
+    'E_Reliability',
+    'E_Quality',
+    'E_Affordability',
+    'E_Legality',
+    'E_Safety',
+]
+
+
+# Health and safety of cooking (I31, multiple choice), coded I31_k = k when selected
+MAJOR_INJURIES = ['I31_1', 'I31_2', 'I31_3', 'I31_4']  # death, burns, cough, other major
+NO_MAJOR_INJURY = ['I31_5', 'I31_6', 'I31_7', 'I31_8']  # minor injury, fire, eyes, none
+
+# Section I has one row per stove. The primary stove is not identified in the
+# data used so far, so the tiers of a household are those of its worst stove.
+# Only the safety rule is backed by the chapter (I31): the other attributes get
+# a rule together with the codebook references of their questions.
+RWANDA_COOKING = {
+    'household_key': 'HHID',
+    'primary': None,
+    'rules': {
+        'C_Safety': {
+            'choices': {3: MAJOR_INJURIES, 5: NO_MAJOR_INJURY},
+        },
+    },
+}
+
+# Attributes of access to modern cooking solutions, the MTF index is their minimum
+COOKING_ATTRIBUTES = [
+    'C_Exposure',
+    'C_Efficiency',
+    'C_Convenience',
+    'C_Safety',
+    'C_Affordability',
+    'C_Fuel_Availability',
+]
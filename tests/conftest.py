@@ -0,0 +1,11 @@
+"""Checks of the helper modules of lib/, run with python -m pytest from the book root."""
+import os
+import sys
+import tempfile
+
+LIB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib')
+sys.path.insert(0, LIB)
+
+# the caches of the checks are kept apart from the cache of the book
+os.environ['MTF_DATA_CACHE'] = tempfile.mkdtemp(prefix='mtf_test_cache_')
+os.environ.pop('MTF_SHARED_DATA', None)
@@ -0,0 +1,62 @@
+import json
+import subprocess
+import sys
+import types
+
+import build_book
+from data_cache import file_fingerprint
+
+
+class _Cache:
+    # the jupyter cache holds the executed notebook
+    def match_cache_notebook(self, nb):
+        return nb
+
+
+def _notebook(directory):
+    path = directory / 'chapter.ipynb'
+    path.write_text(json.dumps({
+        'cells': [{'cell_type': 'code', 'source': "data = mfi.read_survey('results.csv')",
+                   'metadata': {}, 'outputs': [], 'execution_count': None}],
+        'metadata': {'kernelspec': {'name': 'python3'}}, 'nbformat': 4, 'nbformat_minor': 5}))
+    return str(path)
+
+
+def _recorded_reads(*paths):
+    # the reads recorded by the audit hook build_book installs in the kernels
+    code = (build_book.RECORD_READS
+            + ''.join('open(%r).read()\n' % str(p) for p in paths)
+            + 'print(_json.dumps(sorted(_read_files)))')
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                         check=True).stdout
+    return json.loads(out.splitlines()[-1])
+
+
+def test_odk_results_outside_the_book_are_inputs(tmp_path):
+    # ../../../ODK_Collect_Data/... is outside the directory of the book
+    results = tmp_path / 'ODK_Collect_Data' / 'SDG7' / 'results.csv'
+    results.parent.mkdir(parents=True)
+    results.write_text('a,b\n1,2\n')
+    checkpoint = tmp_path / '.ipynb_checkpoints' / 'chapter-checkpoint.ipynb'
+    checkpoint.parent.mkdir()
+    checkpoint.write_text('{}')
+    notebook = _notebook(tmp_path)
+
+    inputs = build_book.notebook_inputs(_recorded_reads(results, checkpoint, notebook), notebook)
+    assert inputs == [str(results)]
+
+
+def test_notebook_is_executed_again_when_its_odk_results_grow(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, 'nbformat',
+                        types.SimpleNamespace(read=lambda path, as_version: path))
+    results = tmp_path / 'results.csv'
+    results.write_text('a,b\n1,2\n')
+    notebook = _notebook(tmp_path)
+    files = build_book.notebook_inputs(_recorded_reads(results), notebook)
+    entry = {'code': build_book.code_hash(notebook),
+             'files': {f: file_fingerprint(f) for f in files}}
+    assert build_book.is_up_to_date(notebook, entry, _Cache())
+
+    with open(results, 'a') as f:
+        f.write('3,4\n')
+    assert not build_book.is_up_to_date(notebook, entry, _Cache())
@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+
+from chart_data import bar_chart_data, get_bar_chart_data
+
+
+def test_layout():
+    df = pd.DataFrame({'Province': ['East', 'West', 'East', 'Kigali', 'East'],
+                       'habitat': ['rural', 'urban', 'rural', 'urban', 'urban']})
+    assert get_bar_chart_data(df, ['East', 'West'], 'Province', ['urban', 'rural'],
+                              'habitat') == {
+        'x_labels': ['East', 'West'],
+        'bars_labels': ['urban', 'rural'],
+        'bars_data': [[1, 1], [2, 0]],
+    }
+
+
+def test_counts_as_pandas():
+    rng = np.random.default_rng(5)
+    df = pd.DataFrame({'Province': rng.choice(['East', 'West', 'North', 'South', None], 1000),
+                       'C182': rng.integers(1, 9, 1000).astype(float)})
+    df.loc[::13, 'C182'] = np.nan
+    groups, answers = ['North', 'East', 'West'], [3.0, 1.0, 2.0, 7.0]
+    data = bar_chart_data(df, groups, 'Province', answers, 'C182')
+    expected = pd.crosstab(df['Province'], df['C182']).reindex(index=groups, columns=answers,
+                                                              fill_value=0)
+    assert data['bars_data'] == [expected[a].tolist() for a in answers]
+    assert all(type(n) is int for counts in data['bars_data'] for n in counts)
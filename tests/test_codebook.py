@@ -0,0 +1,34 @@
+import pandas as pd
+import pytest
+
+import codebook
+
+
+def _sheet(monkeypatch, columns):
+    sheet = pd.DataFrame({'Variable': ['I4', 'I31_1'], 'Label': ['type of stove', 'death'],
+                          'Obs': [10, 2]})
+    for column in columns:
+        sheet[column] = ['1 = Three stone; 2 = Improved', None]
+    monkeypatch.setattr(codebook.pd, 'read_excel', lambda path, sheet_name, dtype: sheet)
+    return codebook.Codebook(codebook.parse_sheet('codebook.xlsx', 'Section I'))
+
+
+def test_value_labels_column_is_read_from_the_header(monkeypatch):
+    book = _sheet(monkeypatch, ['Value  Labels'])
+    assert book.value_labels('I4') == {1: 'Three stone', 2: 'Improved'}
+    assert book.value_labels('I31_1') == {}
+
+
+def test_missing_value_labels_column_fails_clearly(monkeypatch):
+    book = _sheet(monkeypatch, ['Codes'])
+    assert book.label('I4') == 'type of stove'
+    with pytest.raises(ValueError, match="'Section I' has no 'Value labels' column"):
+        book.value_labels('I4')
+
+
+def test_workers_within_the_cpus_of_the_kernel(monkeypatch):
+    monkeypatch.setenv('MTF_KERNEL_CPUS', '1')
+    assert codebook.default_workers(20) == 1
+    monkeypatch.setenv('MTF_KERNEL_CPUS', '4')
+    assert codebook.default_workers(20) == 4
+    assert codebook.default_workers(2) == 2
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from count_cube import CountCube
+
+SOURCE = 'C182_which is the source that you use most of the time'
+
+
+@pytest.fixture
+def main():
+    rng = np.random.default_rng(7)
+    n = 3000
+    main = pd.DataFrame({
+        SOURCE: pd.array(rng.choice([1, 2, 3, 4, 5, 6, 7, None], n), dtype='Int8'),
+        'habitat': pd.Categorical(rng.choice(['urban', 'rural', None], n)),
+        'E_Safety': rng.choice([3.0, 5.0, np.nan], n),
+    })
+    return main
+
+
+def test_counts_as_filters(main):
+    cube = CountCube(main, [SOURCE, 'habitat', 'E_Safety'])
+    sources = [1, 2, 3, 4, 5, 6, 7, 9]
+    assert cube.counts(SOURCE, sources) == [int((main[SOURCE] == s).sum()) for s in sources]
+    for habitat in ('urban', 'rural'):
+        rows = main[main['habitat'] == habitat]
+        assert cube.counts(SOURCE, sources, where={'habitat': habitat}) == \
+            [int((rows[SOURCE] == s).sum()) for s in sources]
+        assert cube.total({'habitat': habitat}) == len(rows)
+        tiers = rows['E_Safety']
+        n_tot = int((tiers == 3).sum() + (tiers == 5).sum())
+        assert cube.percent('E_Safety', [3, 5], where={'habitat': habitat}, of=[3, 5]) == \
+            pytest.approx([100*(tiers == 3).sum()/n_tot, 100*(tiers == 5).sum()/n_tot])
+    assert cube.total() == len(main)
+    assert cube.percent(SOURCE, [1, 4]) == \
+        pytest.approx([100*(main[SOURCE] == s).sum()/len(main) for s in [1, 4]])
+
+
+def test_one_dimension(main):
+    counts = CountCube(main, [SOURCE]).counts(SOURCE, list(range(1, 10)))
+    assert counts == main[SOURCE].value_counts().reindex(range(1, 10), fill_value=0).tolist()
@@ -0,0 +1,57 @@
+import os
+import time
+
+import pandas as pd
+import pytest
+
+import data_cache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_cache, 'CACHE_DIR', str(tmp_path / 'cache'))
+    sources = []
+    for name in ('kept.csv', 'edited.csv', 'deleted.csv'):
+        path = tmp_path / name
+        path.write_text('a,b\n1,2\n')
+        data_cache.cached_read_csv(str(path))
+        sources.append(path)
+    time.sleep(0.01)
+    sources[1].write_text('a,b\n1,3\n')
+    sources[2].unlink()
+    (tmp_path / 'cache' / ('0' * 40 + '.parquet')).write_bytes(b'orphan')
+    return tmp_path
+
+
+def _entries():
+    return sorted(meta['source'] if meta else os.path.basename(files[0])
+                  for meta, files in data_cache.cache_entries())
+
+
+def test_prune_keeps_only_the_entries_in_use(cache):
+    assert len(_entries()) == 4
+    removed = data_cache.prune_cache()
+    assert len(removed) == 5
+    assert _entries() == [str(cache / 'kept.csv')]
+    assert data_cache.cached_read_csv(str(cache / 'kept.csv'))['b'].tolist() == [2]
+
+
+def test_share_only_the_entries_in_use(cache, tmp_path):
+    shared = tmp_path / 'shm'
+    shared.mkdir()
+    data_cache.share_cache(str(shared))
+    assert len(os.listdir(shared)) == 1
+
+
+def test_outdated_shared_copy_is_removed(cache, tmp_path, monkeypatch):
+    shared = tmp_path / 'shm'
+    shared.mkdir()
+    data_cache.share_cache(str(shared))
+    monkeypatch.setattr(data_cache, 'SHARED_DIR', str(shared))
+    (data_file,) = [f for meta, files in data_cache.cache_entries() if meta
+                    and meta['source'] == str(cache / 'kept.csv') for f in files
+                    if f.endswith('.parquet')]
+    time.sleep(0.01)
+    pd.DataFrame({'a': [1], 'b': [4]}).to_parquet(data_file)
+    assert data_cache.read_entry(data_file)['b'].tolist() == [4]
+    assert os.listdir(shared) == []
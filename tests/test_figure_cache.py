@@ -0,0 +1,58 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import figure_cache
+
+
+def _key(value):
+    h = hashlib.sha1()
+    figure_cache._fingerprint(value, h)
+    return h.hexdigest()
+
+
+def test_long_arrays_and_series_are_fingerprinted_whole():
+    values = np.arange(5000.0)
+    changed = values.copy()
+    changed[2500] = -1
+    assert _key(values) != _key(changed)
+    assert _key(values.tolist()) != _key(changed.tolist())
+    assert _key(pd.Series(values)) != _key(pd.Series(changed))
+    assert _key(range(5000)) != _key(range(5001))
+
+
+def test_frames_holding_lists_cannot_be_fingerprinted():
+    with pytest.raises(TypeError):
+        _key(pd.DataFrame({'offices': [[1, 2], [3]]}))
+
+
+class Mfi:
+    def __init__(self):
+        self.HH = pd.DataFrame({'E_Index': [1, 2]})
+        self.offices = ['Lima']
+
+    def tier_barh(self):
+        pass
+
+
+def test_attributes_of_the_object_of_a_method_are_in_the_key():
+    mfi = Mfi()
+    mfi.tier_barh = figure_cache.memoize_figure(mfi.tier_barh)
+    before = _key(figure_cache._owner_state(mfi.tier_barh.__wrapped__))
+    mfi.offices.append('Cusco')
+    assert _key(figure_cache._owner_state(mfi.tier_barh.__wrapped__)) != before
+
+
+def test_files_written_by_a_call_are_recorded(tmp_path):
+    figure_cache._writing.append(set())
+    try:
+        (tmp_path / 'figure.png').write_bytes(b'png')
+        (tmp_path / 'figure.png').read_bytes()
+    finally:
+        written = figure_cache._writing.pop()
+    assert figure_cache._written_files(written) == {str(tmp_path / 'figure.png'): b'png'}
+    (tmp_path / 'figure.png').unlink()
+    figure_cache._restore({str(tmp_path / 'figure.png'): b'png'})
+    assert (tmp_path / 'figure.png').read_bytes() == b'png'
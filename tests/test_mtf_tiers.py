@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from mtf_tiers import electricity_index, electricity_tiers
+
+AVAILABLE = ['E_daily_Availability', 'E_evening_Availability', 'E_Safety']
+
+SOURCE = 'C182_which is the source that you use most of the time'
+
+# (injury, daily availability, evening availability) questions by main source,
+# as in the iterrows cascade of the chapter before tier_rules
+QUESTIONS = {
+    1: ('C41_household member died or damaged because of electricity',
+        'C26b_hours of electricity availability each day and night (Typical Months)',
+        'C27b_hours electricity is available each evening (Typical Month)'),
+    2: ('C83_household members die or injured because of the grid electricity',
+        'C68b_hours of electricity availability each day and night (Typical Months)',
+        'C69b_hours of electricity availability each evening (Typical Months)'),
+    3: ('C112_household members died or injured because of the generator',
+        'C107b_hours could you use this generator each day and night  (Typical Months)',
+        'C108b_hours could you use this generator each evening (Typical Months)'),
+    4: ('C175_household members died or  injured because of the DEVICE',
+        'C172b_hours you receive service from this DEVICE each day and night (Typical Months)',
+        'C173b_C173a_hours is service available from this DEVICE each evening (Typical Months)'),
+    6: ('C130_household members died  injured because of the rechargeable batteries',
+        'C127_hours  you could use rechargeable batteries for electricity supply each day',
+        None),
+    7: ('C142_household members died injured because of the pico-hydro system',
+        'C137b_hours you could use this pico-hydro system each day and night (Typical Months)',
+        'C138b_hours you could use this pico-hydro system each evening (Typical Months)'),
+}
+QUESTIONS[5] = QUESTIONS[4]
+
+
+def _cascade(main):
+    """The tiers computed row by row, as the chapter did before tier_rules."""
+    safety, daily, evening = [], [], []
+    for index, row in main.iterrows():
+        if row[SOURCE] not in QUESTIONS:
+            safety.append(np.nan)
+            daily.append(np.nan)
+            evening.append(np.nan)
+            continue
+        injury, allday, each_evening = QUESTIONS[row[SOURCE]]
+        safety.append({1: 3, 2: 5}.get(row[injury], np.nan))
+        hours = row[allday]
+        daily.append(0 if hours < 4 else 2 if hours < 8 else 3 if hours < 16
+                     else 4 if hours < 23 else 5 if hours >= 23 else np.nan)
+        hours = row[each_evening] if each_evening else np.nan
+        evening.append(0 if hours < 1 else 1 if hours < 2 else 2 if hours < 3
+                       else 3 if hours < 4 else 5 if hours >= 4 else np.nan)
+    return pd.DataFrame({'E_Safety': safety, 'E_daily_Availability': daily,
+                         'E_evening_Availability': evening}, index=main.index)
+
+
+def test_electricity_tiers_as_the_iterrows_cascade():
+    rng = np.random.default_rng(6)
+    n = 2000
+    columns = sorted({q for questions in QUESTIONS.values() for q in questions if q})
+    main = pd.DataFrame({SOURCE: rng.choice([0, 1, 2, 3, 4, 5, 6, 7, 8, np.nan], n)},
+                        index=pd.RangeIndex(100, 100 + n))
+    for column in columns:
+        if column.startswith(('C41', 'C83', 'C112', 'C175', 'C130', 'C142')):
+            main[column] = rng.choice([1, 2, 3, 8, np.nan], n)
+        else:
+            # boundaries, fractions and missing answers
+            main[column] = rng.choice([0, 0.5, 1, 1.5, 2, 3, 3.9, 4, 7, 8, 15.5, 16, 22, 23, 24,
+                                       np.nan], n)
+    pd.testing.assert_frame_equal(electricity_tiers(main, SOURCE)[list(_cascade(main))],
+                                  _cascade(main), check_dtype=False)
+
+
+def test_partial_index_is_the_min_over_the_available_attributes():
+    rng = np.random.default_rng(4)
+    tiers = pd.DataFrame(rng.integers(0, 6, (200, 3)).astype(float), columns=AVAILABLE)
+    tiers.iloc[::7, 1] = np.nan
+    with pytest.raises(ValueError, match='partial'):
+        electricity_index(tiers)
+    index = electricity_index(tiers, partial=True)
+    pd.testing.assert_series_equal(index['E_Index_partial'], tiers.min(axis=1, skipna=False),
+                                   check_names=False)
+    for row, binding in index['E_Index_partial_binding'].dropna().items():
+        assert tiers.loc[row, binding] == index.loc[row, 'E_Index_partial']
+    assert index['E_Index_partial_binding'].isna().sum() == tiers.isna().any(axis=1).sum()
@@ -0,0 +1,112 @@
+import sys
+import time
+
+import pandas as pd
+import pytest
+
+import odk_cache
+
+# this module stands for odk_interface: its households are built by households()
+odk = sys.modules[__name__]
+built = []
+
+
+def households(data):
+    built.append(len(data))
+    return pd.DataFrame({'E_Index': data['x'] % 5, 'latitude': data['lat']}, index=data.index)
+
+
+class Mfi:
+    institution_id = 7
+
+    def read_survey(self, path, delimiter=','):
+        return pd.read_csv(path, delimiter=delimiter)
+
+
+class RankedOdk:
+    # households depending on the other submissions
+    __name__ = __name__
+    __file__ = __file__
+
+    @staticmethod
+    def households(data):
+        return pd.DataFrame({'rank': data['x'].rank()}, index=data.index)
+
+
+def _write(path, text, mode='w'):
+    # a new modification time even on file systems with a coarse clock
+    time.sleep(0.01)
+    with open(path, mode) as f:
+        f.write(text)
+
+
+def _check(paths, odk_module=odk, institution=None, **options):
+    """read_survey_incremental, checked against a full read; number of households built."""
+    built.clear()
+    data, hh = odk_cache.read_survey_incremental(Mfi(), odk_module, paths,
+                                                 institution=institution, **options)
+    count = list(built)
+    full = odk_cache.read_surveys(Mfi(), odk_cache._paths(paths), **options)
+    pd.testing.assert_frame_equal(data, full)
+    pd.testing.assert_frame_equal(hh, odk_module.households(full))
+    return count
+
+
+def test_appended_rows_are_parsed_alone(tmp_path):
+    results = str(tmp_path / 'results.csv')
+    _write(results, 'x,lat\n1,2.5\n2,3.5\n')
+    assert _check(results) == [2]
+    assert _check(results) == []
+    _write(results, '3,4.5\n4,"5.5"\n', 'a')
+    # the new rows, then the full read checking them the first time
+    assert _check(results) == [2, 4]
+    _write(results, '5,6.5', 'a')
+    assert _check(results) == [1]
+
+
+def test_waves_keep_the_order_of_a_full_read(tmp_path):
+    wave_1, wave_2 = str(tmp_path / 'FONDESURCO_1.csv'), str(tmp_path / 'FONDESURCO_2.csv')
+    _write(wave_1, 'x,lat\n1,2.5\n2,3.5\n')
+    _write(wave_2, 'x,lat,gps\n10,1.5,a\n')
+    _check([wave_1, wave_2])
+    _write(wave_1, '3,4.5\n', 'a')
+    assert _check([wave_1, wave_2]) == [4]
+    _write(wave_2, '11,1.5,b\n12,1.5,c\n', 'a')
+    assert _check([wave_1, wave_2]) == [2, 6]
+    _write(wave_2, '13,1.5,d\n', 'a')
+    assert _check([wave_1, wave_2]) == [1]
+
+
+def test_edited_submissions_are_read_again(tmp_path):
+    results = str(tmp_path / 'results.csv')
+    _write(results, 'x,lat\n1,2.5\n2,3.5\n')
+    _check(results)
+    _write(results, 'x,lat\n1,2.5\n7,3.5\n3,1.5\n')
+    assert _check(results) == [3]
+
+
+def test_a_row_read_at_the_end_of_the_file_and_continued_since(tmp_path):
+    results = str(tmp_path / 'results.csv')
+    _write(results, 'x,lat\n1,2.5\n2,3')
+    _check(results)
+    _write(results, '.5\n3,4.5\n', 'a')
+    assert _check(results) == [3]
+
+
+def test_households_depending_on_other_submissions_are_read_in_full(tmp_path):
+    results = str(tmp_path / 'results.csv')
+    _write(results, 'x,lat\n5,2.5\n2,3.5\n')
+    _check(results, RankedOdk)
+    _write(results, '1,4.5\n', 'a')
+    with pytest.warns(UserWarning, match='read in full'):
+        _check(results, RankedOdk)
+    _write(results, '0,4.5\n', 'a')
+    _check(results, RankedOdk)
+
+
+def test_each_institution_has_its_store(tmp_path):
+    results = str(tmp_path / 'results.csv')
+    _write(results, 'x;lat\n1;2.5\n')
+    assert _check(results, delimiter=';') == [1]
+    assert _check(results, delimiter=';', institution=5) == [1]
+    assert _check(results, delimiter=';', institution=5) == []
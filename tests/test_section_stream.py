@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import tier_rules
+from mtf_tiers import household_tiers, stream_household_tiers
+from section_stream import aggregate_section
+from survey_data import SurveyDataset
+
+SAFETY = ['I31_%d' % k for k in range(1, 9)]
+
+
+@pytest.fixture
+def section_I(tmp_path):
+    # one row per stove, several stoves per household, spread over the chunks
+    rng = np.random.default_rng(3)
+    n = 500
+    table = pd.DataFrame({'HHID': rng.integers(1, 120, n), 'I2': rng.integers(1, 4, n)})
+    for k, column in enumerate(SAFETY, 1):
+        table[column] = np.where(rng.random(n) < 0.2, float(k), np.nan)
+    table.loc[::17, 'I31_1'] = 0
+    (tmp_path / 'csv').mkdir()
+    table.to_csv(tmp_path / 'csv' / 'I.csv', index=False)
+    return tmp_path, table
+
+
+def test_sums_as_groupby(section_I):
+    root, table = section_I
+    expected = table.groupby('HHID')[SAFETY].sum()
+    result = aggregate_section(root / 'csv' / 'I.csv', {'sum': SAFETY}, chunksize=37)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+    result = SurveyDataset(root).aggregate('I', {'sum': SAFETY}, chunksize=37)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_any_counts_zero_as_selected(section_I):
+    root, table = section_I
+    expected = table[SAFETY].notna().groupby(table['HHID']).any()
+    result = aggregate_section(root / 'csv' / 'I.csv', {'any': SAFETY}, chunksize=37)
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize('primary', [None, 'I2'])
+def test_stream_household_tiers_as_household_tiers(section_I, primary):
+    root, table = section_I
+    rules = dict(tier_rules.RWANDA_COOKING, primary=primary)
+    expected = household_tiers(table, rules).join(table.groupby('HHID')[SAFETY].sum())
+    result = stream_household_tiers(root / 'csv' / 'I.csv', rules, how={'sum': SAFETY},
+                                    chunksize=37)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)